@@ -0,0 +1,208 @@
+"""
+Benchmark suite for forecast family generation, on synthetic hindcasts (see `benchmarks/synthetic.py`). Each stage
+(reading forecasts, computing families, writing them, and whole driver runs) is timed separately, with the peak of
+memory allocated during the stage. Results can be saved as a baseline, and later runs are compared with it.
+Memory peaks are those of the calling process: for driver runs with several workers, they leave out the memory used
+by worker processes.
+
+Run from main directory, e.g.:
+    python benchmarks/run_benchmarks.py --scale production --save-baseline
+    python benchmarks/run_benchmarks.py --scale production
+"""
+
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from benchmarks.synthetic import write_hindcast
+from src import deterministic, ensemble
+from src.deterministic import ecmwf_deterministic_family
+from src.ensemble import ecmwf_ensemble_family
+from src.forecasts import deterministic_forecast, read_forecast
+from src.history import clear_history_cache, observation_index
+from src.storage import FamilyWriter
+
+# Data set and skill grid sizes, by scale
+SCALES = {'tiny': {'n_members': 5, 'n_lead': 40, 'n_init': 3, 'n_skill': 3},
+          'small': {'n_members': 25, 'n_lead': 215, 'n_init': 12, 'n_skill': 11},
+          'production': {'n_members': 51, 'n_lead': 215, 'n_init': 240, 'n_skill': 21}}
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def measure(stage, results, function, *args, **kwargs):
+
+    """
+    Runs `function(*args, **kwargs)` twice, and records in `results[stage]` its wall-clock time (seconds) in the first
+    run, and the peak of memory allocated in the calling process (MB) in the second run, traced with `tracemalloc`
+    (which slows down allocations, so that it would distort the timing). Returns the result of the first run.
+    """
+
+    start = time.perf_counter()
+    output = function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    results[stage] = {'seconds': elapsed, 'peak_mb': peak / 2 ** 20}
+
+    return output
+
+
+def _read_history(history_file, variable_name):
+    # Every run reads the file, rather than the cache
+    clear_history_cache()
+    return observation_index(history_file, variable_name)
+
+
+def _read_all(data, variable_names):
+    return [read_forecast(data['forecast_folder'], t, variable_names[1]) for t in data['init_dates']]
+
+
+def _compute_all(forecasts, observations, skill_values):
+    families = []
+    for fore_data in forecasts:
+        hist_data = observations.window(fore_data.index)
+        families.append(ensemble.compute_family(hist_data, fore_data, skill_values))
+        for metric in ['MAE', 'MSE']:
+            deterministic.compute_family(hist_data, deterministic_forecast(fore_data, 'Rain'), skill_values, metric)
+    return families
+
+
+def _write_csv(families, forecasts, skill_values, folder):
+    for family, fore_data in zip(families, forecasts):
+        name = fore_data.index[0].strftime('%Y%m%d')
+        ensemble.write_family(family, fore_data.index, fore_data.columns, skill_values, folder + '/CRPSS=', True, name)
+
+
+def _write_store(families, forecasts, skill_values, folder):
+    with FamilyWriter(folder) as writer:
+        for family, fore_data in zip(families, forecasts):
+            writer.write(fore_data.index[0], family, fore_data.index, fore_data.columns, skill_values)
+
+
+def run_suite(scale='small', folder=None, n_workers=1):
+
+    """
+    This function runs the benchmark suite at a given scale.
+
+    :param scale: string, a key of SCALES, or dictionary with keys 'n_members', 'n_lead', 'n_init' and 'n_skill'.
+    :param folder: string, working folder for synthetic data and outputs (default: a temporary folder, deleted after).
+    :param n_workers: int, number of worker processes for the driver runs (whose memory is not measured).
+    :return: dictionary {stage: {'seconds': ..., 'peak_mb': ...}}.
+    """
+
+    sizes = SCALES[scale] if isinstance(scale, str) else scale
+    temporary = folder is None
+    if temporary:
+        folder = tempfile.mkdtemp(prefix='family_benchmarks_')
+    skill_values = np.linspace(0, 1, sizes['n_skill'])
+    results = {}
+
+    try:
+        data = write_hindcast(folder + '/data', n_members=sizes['n_members'], n_lead=sizes['n_lead'],
+                              n_init=sizes['n_init'])
+        variable_names = data['variable_names'][0]
+
+        # Stages of a family run, one at a time
+        observations = measure('read_history', results, _read_history, data['history_file'], variable_names[0])
+        forecasts = measure('read_forecasts', results, _read_all, data, variable_names)
+        families = measure('compute_families', results, _compute_all, forecasts, observations, skill_values)
+        measure('write_csv', results, _write_csv, families, forecasts, skill_values, folder + '/csv')
+        measure('write_store', results, _write_store, families, forecasts, skill_values, folder + '/store')
+        del families, forecasts
+
+        # Whole driver runs
+        args = (data['history_file'], data['forecast_folder'], variable_names, folder + '/drivers', skill_values,
+                data['init_dates'][0], data['init_dates'][-1])
+        os.makedirs(folder + '/drivers', exist_ok=True)
+        measure('ensemble_driver', results, ecmwf_ensemble_family, *args, n_workers=n_workers)
+        measure('deterministic_driver', results, ecmwf_deterministic_family, *args, 'MAE', n_workers=n_workers)
+    finally:
+        if temporary:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    return results
+
+
+def compare(results, baseline):
+
+    """
+    This function compares benchmark results with a baseline.
+
+    :param results: dictionary {stage: {'seconds': ..., 'peak_mb': ...}}, e.g. from `run_suite`.
+    :param baseline: dictionary of the same form.
+    :return: Pandas DataFrame with times and memory peaks of both runs, and their ratios (run / baseline), by stage.
+    """
+
+    table = pd.DataFrame({'seconds': pd.Series({s: results[s]['seconds'] for s in results}),
+                          'baseline_seconds': pd.Series({s: baseline[s]['seconds'] for s in baseline}),
+                          'peak_mb': pd.Series({s: results[s]['peak_mb'] for s in results}),
+                          'baseline_peak_mb': pd.Series({s: baseline[s]['peak_mb'] for s in baseline})})
+    table['time_ratio'] = table['seconds'] / table['baseline_seconds']
+    table['memory_ratio'] = table['peak_mb'] / table['baseline_peak_mb']
+
+    return table.reindex(list(results) + [s for s in baseline if s not in results])
+
+
+def load_baseline(scale, baseline_file=BASELINE_FILE):
+
+    """Baseline results stored for a scale, or None if there are none."""
+
+    if os.path.exists(baseline_file) is False:
+        return None
+    with open(baseline_file) as f:
+        baselines = json.load(f)
+
+    return baselines.get(scale, {}).get('results')
+
+
+def save_baseline(scale, results, baseline_file=BASELINE_FILE):
+
+    """Stores results as the baseline of a scale, with a description of the machine they were obtained on."""
+
+    baselines = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            baselines = json.load(f)
+    baselines[scale] = {'sizes': SCALES.get(scale), 'machine': platform.platform(),
+                        'python': platform.python_version(), 'numpy': np.__version__, 'results': results}
+    with open(baseline_file, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+
+    return None
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmarks of forecast family generation on synthetic hindcasts')
+    parser.add_argument('--scale', default='small', choices=sorted(SCALES))
+    parser.add_argument('--workers', type=int, default=1, help='worker processes for driver runs')
+    parser.add_argument('--folder', default=None, help='working folder (default: temporary folder)')
+    parser.add_argument('--save-baseline', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--baseline-file', default=BASELINE_FILE)
+    arguments = parser.parse_args()
+
+    run_results = run_suite(arguments.scale, arguments.folder, arguments.workers)
+    previous = load_baseline(arguments.scale, arguments.baseline_file)
+    if previous is None:
+        print(pd.DataFrame(run_results).T.to_string(float_format='%.3f'))
+    else:
+        print(compare(run_results, previous).to_string(float_format='%.3f'))
+    if arguments.save_baseline:
+        save_baseline(arguments.scale, run_results, arguments.baseline_file)
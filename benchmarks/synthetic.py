@@ -0,0 +1,81 @@
+"""
+Synthetic hindcast data sets, written in the same formats as the ECMWF data used in the paper: a historical climate
+file, and one forecast CSV file per init date and variable. Sizes can be set up to those of production runs (51
+members, about 215 lead days, decades of monthly init dates).
+
+Rainfall and evaporation are daily amounts accumulated over the forecast period (as in the ECMWF files); temperature
+is a daily value. Forecasts are noisy, biased versions of the observations, so that families span a realistic range
+of skill.
+"""
+
+import pandas as pd
+import numpy as np
+import os
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.forecasts import forecast_path
+
+# Variables of synthetic data sets: name in forecasts -> name in historical data
+VARIABLES = {'Rain': 'Rain', 'Temp': 'Temp', 'Evap': 'PET'}
+
+
+def _daily_values(variable, dates, rng, size=None):
+    # Daily values of a variable, with a seasonal cycle
+    shape = (len(dates),) if size is None else (len(dates), size)
+    season = np.cos(2 * np.pi * (dates.dayofyear.values - 200) / 365.25).reshape((-1,) + (1,) * (len(shape) - 1))
+    if variable == 'Temp':
+        return 10 + 7 * season + rng.normal(0, 3, shape)
+    if variable == 'Evap':
+        return np.maximum(2 + 1.5 * season + rng.normal(0, 0.5, shape), 0)
+    return rng.gamma(0.6, 4 - season, shape)
+
+
+def write_hindcast(folder, n_members=51, n_lead=215, begin_date='1981/01/01', n_init=12, variables=('Rain',),
+                   seed=0):
+
+    """
+    This function writes a synthetic hindcast data set: historical data covering all forecasts, and one forecast CSV
+    file per monthly init date and variable.
+
+    :param folder: string, the folder where to write the data set (created if it does not exist).
+    :param n_members: int, number of ensemble members.
+    :param n_lead: int, number of lead days of each forecast.
+    :param begin_date: first init date. Format 'YYYY/MM/DD'
+    :param n_init: int, number of monthly init dates.
+    :param variables: names of the variables in forecasts, among 'Rain', 'Temp' and 'Evap'.
+    :param seed: int, seed of the random number generator.
+    :return: dictionary with the paths ('history_file', 'forecast_folder'), the variable names (list of duplets) and
+             the init dates of the data set.
+    """
+
+    rng = np.random.default_rng(seed)
+    forecast_folder = folder + '/forecasts'
+    os.makedirs(forecast_folder, exist_ok=True)
+    init_dates = pd.date_range(start=begin_date, periods=n_init, freq='MS')
+
+    # Historical data
+    hist_dates = pd.date_range(init_dates[0], init_dates[-1] + pd.Timedelta(days=n_lead), freq='D')
+    history = pd.DataFrame({VARIABLES[variable]: _daily_values(variable, hist_dates, rng) for variable in variables},
+                           index=hist_dates.strftime('%d/%m/%Y').rename('Date'))
+    history_file = folder + '/history.csv'
+    history.to_csv(path_or_buf=history_file)
+
+    # Forecasts: observations plus a bias and member noise, accumulated for rain and evaporation
+    for variable in variables:
+        observed = history[VARIABLES[variable]].values
+        for t in init_dates:
+            start = hist_dates.get_loc(t)
+            lead_dates = hist_dates[start:start + n_lead]
+            values = 1.1 * observed[start:start + n_lead, np.newaxis] + \
+                _daily_values(variable, lead_dates, rng, n_members) - _daily_values(variable, lead_dates, rng)[:, None]
+            if variable != 'Temp':
+                values = np.cumsum(np.maximum(values, 0), axis=0)
+            forecast = pd.DataFrame(values, index=lead_dates.strftime('%d/%m/%Y').rename('Date'),
+                                    columns=[str(j) for j in range(n_members)])
+            forecast.to_csv(path_or_buf=forecast_path(forecast_folder, t, variable))
+
+    return {'history_file': history_file, 'forecast_folder': forecast_folder, 'init_dates': init_dates,
+            'variable_names': [[VARIABLES[variable], variable] for variable in variables]}
@@ -1,39 +1,69 @@
 import pandas as pd
 import numpy as np
-import math
 import matplotlib.pyplot as plt
 import os
 
+from src.multiplier import blend, compute_multiplier, get_metric
+from src.forecasts import ForecastCube, deterministic_forecast, forecast_name, read_forecast
+from src.history import history_cached, observation_index
+from src.manifest import Manifest, output_options
+from src.parallel import map_dates
+from src.profiling import profile_stage, profiler_options, worker_profiler, worker_records
 
-def generate_family(observations, fore_det, skill_values, skill_name):
+
+def compute_family(observations, fore_det, skill_values, skill_name, dtype=None, multipliers=None):
 
     """
-    This function generates a forecast family given observations and a hindcast, for all the skill values specified.
+    This function computes a whole deterministic forecast family in memory, in a single vectorised operation.
+    Observations and forecasts can have extra leading axes (e.g. sites), so that the families of many forecasts are
+    computed at once.
 
-    :param observations: Pandas Series with the observations.
-    :param fore_det: Pandas Series with the deterministic hindcast.
+    :param observations: Pandas Series (or Numpy array, ... x time) with the observations.
+    :param fore_det: Pandas Series (or Numpy array with the shape of observations) with the deterministic hindcast.
     :param skill_values: vector of floats with the values of the skill that family members should have.
-    :param skill_name: string, the name of the metric upon which skill is based ('MAE' or 'MSE').
-    :return: Pandas DataFrame where each column is a forecast family member.
+    :param skill_name: string, the name of the metric upon which skill is based ('MAE', 'MSE', or another
+           deterministic metric registered in `multiplier.METRICS`, e.g. 'NSE', 'KGE' or 'logNSE').
+    :param dtype: Numpy floating point type of the family (default float64), see `ensemble.compute_family`.
+    :param multipliers: Optional. Numpy array with the multipliers k of the skill values, if already computed.
+    :return: contiguous Numpy array of shape (skill x ... x time), where entry [i] is the family member with skill
+             skill_values[i].
     """
 
-    # Define forecast family
-    family = pd.DataFrame(data=None, index=fore_det.index)
+    obs = np.asarray(observations, dtype=float)
+    fore = np.asarray(fore_det, dtype=float)
+    if fore.shape != obs.shape:
+        raise ValueError("deterministic forecast must have the shape of observations")
+
+    # Convert skill to multiplier k (in closed form for 'MAE' and 'MSE', numerically for metrics such as 'KGE')
+    if get_metric(skill_name)['ensemble'] is True:
+        raise ValueError(skill_name + " is a skill metric for ensemble forecasts")
+    k = compute_multiplier(skill_values, skill_name, obs, fore) if multipliers is None else multipliers
+
+    # All family members at once, in the requested precision
+    family = blend(k, obs, fore, False, dtype)
 
-    # Build forecast family
-    for i in range(len(skill_values)):
+    return np.ascontiguousarray(family)
 
-        skill = skill_values[i]
 
-        # Convert skill to multiplier k
-        if skill_name == 'MAE':
-            k = 1 - skill
-        elif skill_name == 'MSE':
-            k = math.sqrt(1 - skill)
-        else:
-            raise ValueError("input variable 'mase' must be a string with values 'MAE' or 'MSE'")
+def generate_family(observations, fore_det, skill_values, skill_name, profiler=None, dtype=None):
+
+    """
+    This function generates a forecast family given observations and a hindcast, for all the skill values specified.
+
+    :param observations: Pandas Series with the observations.
+    :param fore_det: Pandas Series with the deterministic hindcast.
+    :param skill_values: vector of floats with the values of the skill that family members should have.
+    :param skill_name: string, the name of the metric upon which skill is based ('MAE', 'MSE', or another
+           deterministic metric registered in `multiplier.METRICS`, e.g. 'NSE', 'KGE' or 'logNSE').
+    :param profiler: Optional. `profiling.StageProfiler` recording the 'compute_family' stage.
+    :param dtype: Numpy floating point type of the family (default float64), see `ensemble.compute_family`.
+    :return: Pandas DataFrame where each column is a forecast family member.
+    """
 
-        family.insert(i, column='S=' + str(skill), value=(1 - k) * observations.values + k * fore_det.values)
+    # Build forecast family: one column per skill value
+    with profile_stage(profiler, 'compute_family', fore_det.index[0]):
+        family = pd.DataFrame(data=compute_family(observations, fore_det, skill_values, skill_name, dtype).T,
+                              index=fore_det.index, columns=['S=' + str(skill) for skill in skill_values])
 
     return family
 
@@ -48,33 +78,37 @@ def plot_family(history_file, benchmark_path, var_name, skill_name, skill_specs,
         MSE (mean squared error)
 
         :param history_file: string, the path to observations
-        :param benchmark_path: string, the path to the benchmark forecast
+        :param benchmark_path: string, the path to the benchmark forecast, Pandas DataFrame with the benchmark
+               forecast ensemble, or `forecasts.ForecastCube` holding it (with the init date given as `init_date=`)
         :param var_name: string vector length 2, the names of the forecast quantity, both in observations and forecast
                data
-        :param skill_name: string, the name of the metric upon which skill is based ('MAE' or 'MSE').
+        :param skill_name: string, the name of the metric upon which skill is based ('MAE', 'MSE', or another
+               deterministic metric registered in `multiplier.METRICS`).
         :param skill_specs: Pandas DataFrame that contains the list of skills but also info to plot them
         :param destination: string, destination folder of the figures
         Optional argument: display the Figures directly in the Notebook when `display=True`
+        Optional argument: init date of the benchmark forecast with `init_date=`, when it is read from a forecast cube
         :return: the function saves the resulting figure in PNG format
         """
 
-    # Optional argument
+    # Optional arguments
     display = kwargs.pop("display", False)
+    init_date = kwargs.pop("init_date", None)
 
     # Read original forecast (which is also the zero-skill family member)
-    benchmark_ensemble = pd.read_csv(benchmark_path, index_col=0)
-    benchmark_ensemble.index = pd.to_datetime(np.array(benchmark_ensemble.index), format='%Y/%m/%d')
+    if isinstance(benchmark_path, ForecastCube):
+        if init_date is None:
+            raise ValueError("init_date is needed to read the benchmark forecast from a forecast cube")
+        benchmark_ensemble = read_forecast(benchmark_path, init_date, var_name)
+    elif isinstance(benchmark_path, pd.DataFrame):
+        benchmark_ensemble = benchmark_path
+    else:
+        benchmark_ensemble = pd.read_csv(benchmark_path, index_col=0)
+        benchmark_ensemble.index = pd.to_datetime(np.array(benchmark_ensemble.index), format='%Y/%m/%d')
     benchmark_forecast = pd.Series(benchmark_ensemble.mean(axis=1))
 
-    # Read historical data
-    hist_all = pd.read_csv(history_file, index_col=0)
-    hist_all.index = pd.to_datetime(np.array(hist_all.index), format='%d/%m/%Y')
-    # Get the historical data that corresponds to the forecast period
-    hist_data = pd.Series(hist_all.loc[benchmark_forecast.index][var_name])
-
-    # For precipitation and evaporation: historical data needs to be turned into a cumulative sum
-    if var_name == 'Rain' or var_name == 'PET':
-        hist_data = hist_data.cumsum()
+    # Get the historical data that corresponds to the forecast period (cumulative for precipitation and evaporation)
+    hist_data = observation_index(history_file, var_name).window(benchmark_forecast.index)
 
     # Compute the forecast family
     family = generate_family(hist_data, benchmark_forecast, skill_specs.loc[:, 'value'], skill_name)
@@ -106,6 +140,8 @@ def plot_family(history_file, benchmark_path, var_name, skill_name, skill_specs,
         title_figure = '(a) Skill based on MAE'
     elif skill_name == 'MSE':
         title_figure = '(b) Skill based on MSE'
+    else:
+        title_figure = 'Skill based on ' + skill_name
     ax.set_title(title_figure, size=16)
 
     # Other figure specs
@@ -121,13 +157,14 @@ def plot_family(history_file, benchmark_path, var_name, skill_name, skill_specs,
 
     # Enable/disable display in Jupyter Notebook
     if display is not True:
-        fig.clf()
+        plt.close(fig)
 
     return None
 
 
 def ecmwf_deterministic_family(history_file, forecast_folder, variable_names, family_folder, skill_val, begin_date,
-                               end_date, mase):
+                               end_date, mase, writer=None, n_workers=1, manifest=None, profiler=None, dtype=None,
+                               float_format=None):
 
     """ For the specified range of dates, this function creates deterministic forecast families from existing
         ECMWF forecasts.
@@ -141,13 +178,37 @@ def ecmwf_deterministic_family(history_file, forecast_folder, variable_names, fa
         inputs = (history_file, forecast_folder, variable_name, family_folder, skill_val, begin_date, end_date, mase)
 
         history_file        = Full path to file with historical data for which we have the forecasts
-        forecast_folder     = Path to the folder where the forecasts are. Enter as string.
+        forecast_folder     = Path to the folder where the forecasts are. Enter as string. Alternatively, a
+                              `forecasts.ForecastCube` with the forecasts (see `forecasts.ingest_forecasts`).
         variable_names      = String duplet with the name of the variable both in historical data and forecasts
         family_folder       = Folder where to save outputs. Enter as string.
         skill_val           = 1-D Numpy array with the desired skill values (typically between 0 and 1).
         begin_date          = date at which we start making families from available forecasts. Format 'YYYY/MM/DD'
         end_date            = date after which we stop making families from available forecasts. Format 'YYYY/MM/DD'
-        mase                = The performance metric used to compute the skill: string 'MAE' or 'MSE'
+        mase                = The performance metric used to compute the skill: string 'MAE' or 'MSE' (or another
+                              deterministic metric registered in `multiplier.METRICS`, e.g. 'KGE')
+        writer              = Optional. Object with a method
+                              `write(init_date, family, lead_dates, members, skill_values)`
+                              that stores the family (3-D array, skill x lead x member, with a single member) of each
+                              init date, e.g. a `storage.FamilyWriter`. Default (None) writes one CSV file per init
+                              date.
+        n_workers           = Optional. Number of processes over which init dates are spread (default 1: serial run).
+                              CSV files are written by the worker processes; with a writer, families are written by the
+                              calling process, in date order. Outputs are identical to those of a serial run.
+        manifest            = Optional. `manifest.Manifest` (or path to a manifest file) recording CSV outputs, so that
+                              init dates whose families were already generated from the same forecast and historical
+                              data (and with the same dtype and float_format) are skipped. As all skill values of an
+                              init date share a file, the file is one output generated from the whole list of skill
+                              values: any change to that list means generating the whole file again.
+        profiler            = Optional. `profiling.StageProfiler` recording time, bytes read and written, and peak
+                              memory of each stage (read_history, read_csv, parse_dates, align_history,
+                              ensemble_average, compute_family, write_csv or write) and init date, also when run on
+                              worker processes. No bytes are read by read_history when historical data is cached in
+                              memory.
+        dtype               = Optional. Numpy floating point type of the families (default float64), e.g. np.float32
+                              to halve memory use and the size of family stores (see `ensemble.compute_family`).
+        float_format        = Optional. Format of values in CSV files (e.g. '%.2f'). Default (None) writes the
+                              shortest representation that reads back to the same value in the family's data type.
 
         No output variable: output printed to file
     """
@@ -155,34 +216,84 @@ def ecmwf_deterministic_family(history_file, forecast_folder, variable_names, fa
     # List dates for forecasts to pull
     date_list = pd.date_range(start=begin_date, end=end_date, freq='MS')
 
-    # Read historical data
-    hist_all = pd.read_csv(history_file, index_col=0)
-    hist_all.index = pd.to_datetime(np.array(hist_all.index), format='%d/%m/%Y')
+    # Read historical data, indexed for quick access to observations over each forecast period
+    with profile_stage(profiler, 'read_history', variable=variable_names[0]) as record:
+        cached = history_cached(history_file)
+        observations = observation_index(history_file, variable_names[0])
+        record['bytes_read'] = 0 if cached else os.path.getsize(history_file)
+
+    # Skip init dates whose outputs are up to date in the manifest
+    pending = None
+    if manifest is not None:
+        if writer is not None:
+            raise ValueError("a manifest can only be used with CSV outputs")
+        if isinstance(manifest, str):
+            manifest = Manifest(manifest)
+        options = output_options(dtype, float_format)
+        options['skill_values'] = np.atleast_1d(np.asarray(skill_val, dtype=float)).tolist()
+        pending = manifest.pending(date_list, history_file, forecast_folder, variable_names, mase, skill_val,
+                                   lambda t, skill: _deterministic_output(family_folder, t, variable_names[1], mase),
+                                   options)
+        date_list = [t for t in date_list if t in pending]
+
+    # Loop on forecast dates, possibly in parallel
+    shared = {'observations': observations, 'forecast_folder': forecast_folder, 'variable_names': variable_names,
+              'family_folder': family_folder, 'skill_val': skill_val, 'mase': mase, 'to_csv': writer is None,
+              'profile': profiler_options(profiler), 'dtype': dtype, 'float_format': float_format}
+    for t, (result, records) in map_dates(_deterministic_family_date, date_list, shared, n_workers):
+        if profiler is not None:
+            profiler.extend(records)
+        if writer is not None:
+            family, benchmark = result
+            with profile_stage(profiler, 'write', t, variable_names[1]) as record:
+                writer.write(t, family.values.T[:, :, np.newaxis], family.index, [benchmark.name], skill_val)
+                record['bytes_written'] = family.values.nbytes
+        if manifest is not None:
+            manifest.record(t, variable_names[1], mase, skill_val,
+                            _deterministic_output(family_folder, t, variable_names[1], mase), pending[t][1])
 
-    # Loop on forecast dates
-    for t in date_list:
+    return None
 
-        # Read forecast data
-        fore_data = pd.read_csv(forecast_folder + '/' + str(10000*t.year + 100*t.month + t.day) + '_1d_7m_ECMWF_' +
-                                variable_names[1] + '.csv', index_col=0)
-        fore_data.index = pd.to_datetime(np.array(fore_data.index), format='%d/%m/%Y')
 
-        # Define deterministic forecast using the ensemble average
-        deterministic_forecast = pd.Series(data=fore_data.mean(axis=1), index=fore_data.index, name='Forecast ' +
-                                           variable_names[1] + ': average')
+def _deterministic_output(family_folder, t, variable_name, mase):
+    # Path to the CSV file of a family written by `ecmwf_deterministic_family`
+    return family_folder + '/' + forecast_name(t, variable_name) + '_' + mase + '_Family.csv'
 
-        # Get the historical data that corresponds to the forecast period
-        hist_data = pd.Series(hist_all.loc[fore_data.index][variable_names[0]])
 
-        # For precipitation and evaporation: historical data needs to be turned into a cumulative sum
-        if variable_names[0] == 'Rain' or variable_names[0] == 'PET':
-            hist_data = hist_data.cumsum()
+def _deterministic_family_date(t, observations, forecast_folder, variable_names, family_folder, skill_val, mase,
+                               to_csv, profile, dtype, float_format):
 
-        # Generate the desired deterministic forecast family
-        family = generate_family(hist_data, deterministic_forecast, skill_val, mase)
+    """
+    Generates the deterministic forecast family for init date t (see `ecmwf_deterministic_family`). If `to_csv` is
+    True, the family is written to CSV and the result is None; otherwise, the result is the family and the benchmark
+    forecast. Returns the result, and the records of a profiler created from `profile` options (None if `profile` is
+    None).
+    """
 
-        # Save family to CSV
-        family.to_csv(path_or_buf=family_folder + '/' + str(10000*t.year + 100*t.month + t.day) + '_1d_7m_ECMWF_' +
-                      variable_names[1] + '_' + mase + '_Family.csv')
+    profiler = worker_profiler(profile)
 
-    return None
+    # Read forecast data
+    fore_data = read_forecast(forecast_folder, t, variable_names[1], profiler)
+
+    # Define deterministic forecast using the ensemble average
+    with profile_stage(profiler, 'ensemble_average', t, variable_names[1]):
+        benchmark = deterministic_forecast(fore_data, variable_names[1])
+
+    # Get the historical data that corresponds to the forecast period (cumulative for precipitation and evaporation)
+    with profile_stage(profiler, 'align_history', t, variable_names[1]):
+        hist_data = observations.window(fore_data.index)
+
+    # Generate the desired deterministic forecast family
+    with profile_stage(profiler, 'compute_family', t, variable_names[1]):
+        family = generate_family(hist_data, benchmark, skill_val, mase, dtype=dtype)
+
+    # Save family to CSV, or hand it over
+    if to_csv is True:
+        output = _deterministic_output(family_folder, t, variable_names[1], mase)
+        with profile_stage(profiler, 'write_csv', t, variable_names[1]) as record:
+            family.to_csv(path_or_buf=output, float_format=float_format)
+            if profiler is not None:
+                record['bytes_written'] = os.path.getsize(output)
+        return None, worker_records(profiler)
+
+    return (family, benchmark), worker_records(profiler)
@@ -0,0 +1,112 @@
+"""
+Fused driver for ECMWF forecast families: several variables and several metrics in a single pass over the forecasts.
+For each init date, each forecast is read once and its ensemble average is computed once, and all requested families
+(ensemble families for ensemble metrics, families of the ensemble average for deterministic metrics) are generated
+from them. Outputs are the same as those of `ensemble.ecmwf_ensemble_family` and
+`deterministic.ecmwf_deterministic_family` called for each variable and metric.
+"""
+
+import pandas as pd
+import numpy as np
+
+from src import deterministic, ensemble
+from src.forecasts import deterministic_forecast, forecast_name, read_forecast
+from src.history import observation_index
+from src.multiplier import get_metric
+from src.parallel import map_dates
+
+
+def ecmwf_families(history_file, forecast_folder, variables, family_folder, skill_values, begin_date, end_date,
+                   metrics=('CRPSS', 'MAE', 'MSE'), writers=None, n_workers=1, dtype=None, float_format=None):
+
+    """
+    This function creates the forecast families of several variables, for several metrics, from existing ECMWF
+    forecasts, reading each forecast only once.
+
+    :param history_file: string, full path to file with historical data for which we have the forecasts.
+    :param forecast_folder: string, the path to the folder where the forecasts are, or a `forecasts.ForecastCube`.
+    :param variables: list of string duplets with the name of each variable both in historical data and forecasts,
+           e.g. [['Rain', 'Rain'], ['Temp', 'Temp'], ['PET', 'Evap']].
+    :param family_folder: string, folder where to save outputs (CSV files laid out as by the single-metric drivers).
+    :param skill_values: 1-D Numpy array with the desired skill values (typically between 0 and 1).
+    :param begin_date: first init date. Format 'YYYY/MM/DD'
+    :param end_date: last init date. Format 'YYYY/MM/DD'
+    :param metrics: strings, the metrics upon which skill is based (default CRPSS, MAE and MSE). Ensemble metrics give
+           ensemble families, deterministic metrics give families of the ensemble average.
+    :param writers: Optional. Dictionary {(forecast variable name, metric): writer} of objects with a method
+           `write(init_date, family, lead_dates, members, skill_values)`, e.g. `storage.FamilyWriter`. Families with a
+           writer are handed over to it (in date order) rather than written to CSV files.
+    :param n_workers: number of processes over which init dates are spread (default 1: serial run).
+    :param dtype: Numpy floating point type of the families (default float64), see `ensemble.compute_family`.
+    :param float_format: string, format of values in CSV files (e.g. '%.2f'), see `ensemble.write_family`.
+    :return: None
+    """
+
+    # Fail early on unknown metrics
+    for metric in metrics:
+        get_metric(metric)
+    if writers is None:
+        writers = {}
+
+    # List dates for forecasts to pull
+    date_list = pd.date_range(start=begin_date, end=end_date, freq='MS')
+
+    # Read historical data once, indexed for quick access to observations of each variable
+    observations = {names[0]: observation_index(history_file, names[0]) for names in variables}
+
+    # Loop on forecast dates, possibly in parallel
+    shared = {'observations': observations, 'forecast_folder': forecast_folder, 'variables': variables,
+              'family_folder': family_folder, 'skill_values': skill_values, 'metrics': metrics, 'dtype': dtype,
+              'float_format': float_format,
+              'to_csv': [(names[1], metric) not in writers for names in variables for metric in metrics]}
+    for t, results in map_dates(_families_date, date_list, shared, n_workers):
+        for (variable, metric), (family, lead_dates, members) in results.items():
+            writers[(variable, metric)].write(t, family, lead_dates, members, skill_values)
+
+    return None
+
+
+def _families_date(t, observations, forecast_folder, variables, family_folder, skill_values, metrics, dtype,
+                   float_format, to_csv):
+
+    """
+    Generates all families of init date t (see `ecmwf_families`). Families flagged in `to_csv` (one flag per variable
+    and metric, in that order) are written to CSV files; the others are returned in a dictionary
+    {(forecast variable name, metric): (family, lead dates, members)}.
+    """
+
+    results = {}
+    flags = iter(to_csv)
+    for names in variables:
+
+        # Read forecast data, observations over the forecast period, and ensemble average, once for all metrics
+        fore_data = read_forecast(forecast_folder, t, names[1])
+        hist_data = observations[names[0]].window(fore_data.index)
+        benchmark = None
+
+        for metric in metrics:
+            csv = next(flags)
+
+            # Ensemble family
+            if get_metric(metric)['ensemble'] is True:
+                family = ensemble.compute_family(hist_data, fore_data, skill_values, metric, dtype)
+                if csv is True:
+                    output = family_folder + '/ECMWF_Ensemble_skill_' + metric + '='
+                    output_name = forecast_name(t, names[1])
+                    ensemble.write_family(family, fore_data.index, fore_data.columns, skill_values, output, True,
+                                          output_name, float_format)
+                else:
+                    results[(names[1], metric)] = (family, fore_data.index, fore_data.columns)
+                continue
+
+            # Deterministic family of the ensemble average
+            if benchmark is None:
+                benchmark = deterministic_forecast(fore_data, names[1])
+            family = deterministic.generate_family(hist_data, benchmark, skill_values, metric, dtype=dtype)
+            if csv is True:
+                family.to_csv(path_or_buf=deterministic._deterministic_output(family_folder, t, names[1], metric),
+                              float_format=float_format)
+            else:
+                results[(names[1], metric)] = (family.values.T[:, :, np.newaxis], family.index, [benchmark.name])
+
+    return results
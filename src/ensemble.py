@@ -2,44 +2,116 @@ import pandas as pd
 import numpy as np
 import os
 import matplotlib.pyplot as plt
+from functools import partial
 
+from src.forecasts import ForecastCube, forecast_name, read_forecast
+from src.history import history_cached, observation_index
+from src.manifest import Manifest, output_options
+from src.multiplier import blend, compute_multiplier, get_metric
+from src.parallel import map_dates
+from src.pipeline import BackgroundWriter, prefetch
+from src.profiling import profile_stage, profiler_options, worker_profiler, worker_records
 
-def generate_family(observations, forecast_ensemble, skill_values, family_folder, different_folders, output_filename):
+
+def compute_family(observations, forecast_ensemble, skill_values, skill_name='CRPSS', dtype=None, multipliers=None):
 
     """
-    This function generates a forecast family given observations and a hindcast, for all the skill values specified.
+    This function computes a whole forecast family in memory, in a single vectorised operation. Observations and
+    forecasts can have extra leading axes (e.g. sites), so that the families of many forecasts are computed at once.
 
-    :param observations: Pandas Series with the observations.
-    :param forecast_ensemble: Pandas DataFrame with the original (benchmark) hindcast ensemble.
+    :param observations: Pandas Series (or Numpy array, ... x time) with the observations.
+    :param forecast_ensemble: Pandas DataFrame (or Numpy array, ... x time x member) with the benchmark hindcast
+           ensemble.
     :param skill_values: vector of floats with the values of the skill that family members should have.
+    :param skill_name: string, the name of the metric upon which skill is based: 'CRPSS' (default), or another
+           ensemble metric registered in `multiplier.METRICS`.
+    :param dtype: Numpy floating point type of the family (default float64). Multipliers are always solved in float64;
+           with float32, members are within a few float32 rounding errors (relative error about 1e-7) of float64
+           members, and members with skill 0 and 1 are exactly the benchmark and the observations.
+    :param multipliers: Optional. Numpy array with the multipliers k of the skill values, if already computed (e.g. on
+           a whole forecast of which this is a slice, see `multiplier.compute_multiplier`).
+    :return: contiguous Numpy array of shape (skill x ... x time x member), where entry [i] is the family member
+             with skill skill_values[i].
+    """
+
+    # Observations with a member axis of length 1, to broadcast against the ensemble
+    obs = np.asarray(observations, dtype=float)
+    fore = np.asarray(forecast_ensemble, dtype=float)
+    if fore.shape[:-1] != obs.shape:
+        raise ValueError("forecast ensemble must have the shape of observations, plus a member axis")
+
+    # Multipliers k (k = 1 - skill for CRPSS), broadcast along the skill axis (and any extra axes, if solved for each
+    # forecast numerically)
+    if get_metric(skill_name)['ensemble'] is False:
+        raise ValueError(skill_name + " is a skill metric for deterministic forecasts")
+    k = compute_multiplier(skill_values, skill_name, obs, fore) if multipliers is None else multipliers
+
+    # All family members at once, in the requested precision
+    family = blend(k, obs, fore, True, dtype)
+
+    return np.ascontiguousarray(family)
+
+
+def write_family(family, index, columns, skill_values, family_folder, different_folders, output_filename,
+                 float_format=None):
+
+    """
+    This function writes a forecast family computed with `compute_family` to CSV files, one per skill value.
+
+    :param family: 3-D Numpy array (skill x time x member) with the forecast family.
+    :param index: index of the forecasts (dates), used as index of the CSV files.
+    :param columns: names of the ensemble members, used as column names of the CSV files.
+    :param skill_values: vector of floats with the values of the skill of family members.
     :param family_folder: string indicating where to save outputs
     :param different_folders: boolean, if True save outputs in different folders
     :param output_filename: string, common part of file name for family members.
+    :param float_format: string, format of values in CSV files (e.g. '%.3f'). Default (None) writes the shortest
+           representation that reads back to the same value in the family's data type.
     :return: Each ensemble in the forecast family is written to a separate CSV file.
     """
 
     # Loop on skill values
     for i in range(len(skill_values)):
 
-        # Compute multiplier k
-        k = 1 - skill_values[i]
-
         # Member of the forecast family for this skill level
-        family_member = pd.DataFrame(data=None, index=forecast_ensemble.index)
-        for j in range(forecast_ensemble.shape[1]):
-            family_member.insert(j, column=forecast_ensemble.columns[j],
-                                 value=(1 - k) * observations.values + k * forecast_ensemble.values[:, j])
+        family_member = pd.DataFrame(data=family[i], index=index, columns=columns)
 
         if different_folders is True:
             skill_folder = family_folder + str("%.2f" % skill_values[i])
-            if os.path.exists(skill_folder) is False:
-                os.mkdir(skill_folder)
-            family_member.to_csv(path_or_buf=skill_folder + '/' + output_filename + '.csv')
+            os.makedirs(skill_folder, exist_ok=True)
+            family_member.to_csv(path_or_buf=skill_folder + '/' + output_filename + '.csv', float_format=float_format)
         else:
-            if os.path.exists(family_folder) is False:
-                os.mkdir(family_folder)
+            os.makedirs(family_folder, exist_ok=True)
             family_member.to_csv(path_or_buf=family_folder + '/' + output_filename + '_' +
-                                 str("%03d" % int(100*skill_values[i])) + '.csv')
+                                 str("%03d" % int(100*skill_values[i])) + '.csv', float_format=float_format)
+
+    return None
+
+
+def generate_family(observations, forecast_ensemble, skill_values, family_folder, different_folders, output_filename,
+                    profiler=None, dtype=None, float_format=None):
+
+    """
+    This function generates a forecast family given observations and a hindcast, for all the skill values specified.
+
+    :param observations: Pandas Series with the observations.
+    :param forecast_ensemble: Pandas DataFrame with the original (benchmark) hindcast ensemble.
+    :param skill_values: vector of floats with the values of the skill that family members should have.
+    :param family_folder: string indicating where to save outputs
+    :param different_folders: boolean, if True save outputs in different folders
+    :param output_filename: string, common part of file name for family members.
+    :param profiler: Optional. `profiling.StageProfiler` recording the 'compute_family' and 'write_csv' stages.
+    :param dtype: Numpy floating point type of the family (default float64), see `compute_family`.
+    :param float_format: string, format of values in CSV files (e.g. '%.2f'), see `write_family`.
+    :return: Each ensemble in the forecast family is written to a separate CSV file.
+    """
+
+    # Compute the whole family at once, then write it
+    with profile_stage(profiler, 'compute_family', forecast_ensemble.index[0]):
+        family = compute_family(observations, forecast_ensemble, skill_values, dtype=dtype)
+    with profile_stage(profiler, 'write_csv', forecast_ensemble.index[0]):
+        write_family(family, forecast_ensemble.index, forecast_ensemble.columns, skill_values, family_folder,
+                     different_folders, output_filename, float_format)
 
     return None
 
@@ -52,22 +124,39 @@ def plot_family(hist_file, forecast_path, family_path, skill_values, var_name, d
     NOTE: this function only supports skill of an ensemble forecast based on CRPSS (continuous rank probability
     skill score)
     :param hist_file: string, the path to observations
-    :param forecast_path: string, the path to the benchmark forecast
+    :param forecast_path: string, the path to the benchmark forecast, Pandas DataFrame with the benchmark forecast,
+           or `forecasts.ForecastCube` holding it (with the init date given as `init_date=`)
     :param family_path: string vector of length 2,
            with the path name before and after reference to the value of the skill
     :param skill_values: vector of floats with the different values of ensemble skill (based on CRPSS) to be trialled.
-    :param var_name: the name of the forecast quantity in observational data
+    :param var_name: the name of the forecast quantity in observational data (and in the forecast cube)
     :param destination: string, destination folder of the figures
     Optional argument: display the Figures directly in the Notebook when `display=True`
+    Optional argument: init date of the benchmark forecast with `init_date=`, when it is read from a forecast cube
+    Optional argument: read the family from a binary family store with `store=storage.FamilyStore(...)` rather than
+                       from CSV files (`family_path` is then ignored); the init date is the first forecast date
+    Optional argument: plot a family computed in memory with `family=` Numpy array (skill x time x member), e.g. from
+                       `compute_family` (`family_path` is then ignored). For many forecasts and skill values, see
+                       `plots.render_family`, which reuses a single figure.
     :return: the function saves the resulting figures in PNG format
     """
 
-    # Optional argument
+    # Optional arguments
     display = kwargs.pop("display", False)
+    store = kwargs.pop("store", None)
+    family = kwargs.pop("family", None)
+    init_date = kwargs.pop("init_date", None)
 
     # Read original forecast (which is also the zero-skill family member)
-    benchmark_forecast = pd.read_csv(forecast_path, index_col=0)
-    benchmark_forecast.index = pd.to_datetime(np.array(benchmark_forecast.index), format='%Y/%m/%d')
+    if isinstance(forecast_path, ForecastCube):
+        if init_date is None:
+            raise ValueError("init_date is needed to read the benchmark forecast from a forecast cube")
+        benchmark_forecast = read_forecast(forecast_path, init_date, var_name)
+    elif isinstance(forecast_path, pd.DataFrame):
+        benchmark_forecast = forecast_path
+    else:
+        benchmark_forecast = pd.read_csv(forecast_path, index_col=0)
+        benchmark_forecast.index = pd.to_datetime(np.array(benchmark_forecast.index), format='%Y/%m/%d')
     benchmark_stats = pd.DataFrame({'min': benchmark_forecast.min(axis=1),
                                     'mean': benchmark_forecast.mean(axis=1),
                                     'max': benchmark_forecast.max(axis=1)}, index=benchmark_forecast.index)
@@ -77,14 +166,8 @@ def plot_family(hist_file, forecast_path, family_path, skill_values, var_name, d
     all_date_labels = ['J', 'F', 'M', 'A', 'M', 'J', 'J', 'A', 'S', 'O', 'N', 'D', 'J', 'F', 'M', 'A', 'M', 'J', 'J']
     date_label = all_date_labels[int(date_list[0].month) - 1: int(date_list[0].month) + 7]
 
-    # Read historical data
-    hist_all = pd.read_csv(hist_file, index_col=0)
-    hist_all.index = pd.to_datetime(np.array(hist_all.index), format='%d/%m/%Y')
-    # Get the historical data that corresponds to the forecast period
-    hist_data = pd.Series(hist_all.loc[benchmark_forecast.index][var_name])
-    # For precipitation and evaporation: historical data needs to be turned into a cumulative sum
-    if var_name == 'Rain' or var_name == 'PET':
-        hist_data = hist_data.cumsum()
+    # Get the historical data that corresponds to the forecast period (cumulative for precipitation and evaporation)
+    hist_data = observation_index(hist_file, var_name).window(benchmark_forecast.index)
 
     # Figures
     for i in range(len(skill_values)):
@@ -102,9 +185,15 @@ def plot_family(hist_file, forecast_path, family_path, skill_values, var_name, d
                         alpha=.2, color='black')
 
         # Read current forecast (family path with a part after and a part before the call to the skill specification)
-        modified_forecast = pd.read_csv(family_path[0] + str("%03d" % int(100 * skill_values[i])) +
-                                        family_path[1] + '.csv', index_col=0)
-        modified_forecast.index = pd.to_datetime(np.array(modified_forecast.index), format='%Y/%m/%d')
+        if family is not None:
+            modified_forecast = pd.DataFrame(data=family[i], index=benchmark_forecast.index,
+                                             columns=benchmark_forecast.columns)
+        elif store is None:
+            modified_forecast = pd.read_csv(family_path[0] + str("%03d" % int(100 * skill_values[i])) +
+                                            family_path[1] + '.csv', index_col=0)
+            modified_forecast.index = pd.to_datetime(np.array(modified_forecast.index), format='%Y/%m/%d')
+        else:
+            modified_forecast = store.member(benchmark_forecast.index[0], skill_values[i])
 
         # Plot current forecast vs. observed data
         hf, = ax.plot(modified_forecast.index, modified_forecast.iloc[:, 0], c='red', linewidth=0.5,
@@ -133,13 +222,14 @@ def plot_family(hist_file, forecast_path, family_path, skill_values, var_name, d
 
         # Enable/disable display in Jupyter Notebook
         if display is not True:
-            fig.clf()
+            plt.close(fig)
 
     return None
 
 
 def ecmwf_ensemble_family(history_file, forecast_folder, variable_names, family_folder, skill_values, begin_date,
-                          end_date):
+                          end_date, writer=None, n_workers=1, manifest=None, profiler=None, dtype=None,
+                          float_format=None, pipeline=False, queue_size=4):
 
     """ This function creates families of new ensemble forecasts of desired skills from existing ensemble forecasts.
         It then saves the resulting forecast families in CSV files: 1 per forecast
@@ -149,41 +239,174 @@ def ecmwf_ensemble_family(history_file, forecast_folder, variable_names, family_
         inputs = (history_file, forecast_folder, variable_name, family_folder, skill_values, begin_date, end_date)
 
         history_file        = Full path to file with historical data for which we have the forecasts
-        forecast_folder     = Path to the folder where the forecasts are. Enter as string.
+        forecast_folder     = Path to the folder where the forecasts are. Enter as string. Alternatively, a
+                              `forecasts.ForecastCube` with the forecasts (see `forecasts.ingest_forecasts`).
         variable_names      = String duplet with the name of the variable both in historical data and forecasts
         family_folder       = Folder where to save outputs. Enter as string.
         skill_values        = 1-D Numpy array with the desired skill values (typically between 0 and 1).
         begin_date          = date at which we start making families from available forecasts. Format 'YYYY/MM/DD'
         end_date            = date after which we stop making families from available forecasts. Format 'YYYY/MM/DD'
+        writer              = Optional. Object with a method
+                              `write(init_date, family, lead_dates, members, skill_values)`
+                              that stores the family (3-D array, skill x lead x member) of each init date, e.g. a
+                              `storage.FamilyWriter`. Default (None) writes one CSV file per skill value and init date.
+        n_workers           = Optional. Number of processes over which init dates are spread (default 1: serial run).
+                              CSV files are written by the worker processes; with a writer, families are written by the
+                              calling process, in date order. Outputs are identical to those of a serial run.
+        manifest            = Optional. `manifest.Manifest` (or path to a manifest file) recording CSV outputs, so that
+                              outputs already generated from the same forecast and historical data (and with the same
+                              dtype and float_format) are not generated again. Use it to resume interrupted runs, or
+                              to add skill values to a previous run.
+        profiler            = Optional. `profiling.StageProfiler` recording time, bytes read and written, and peak
+                              memory of each stage (read_history, read_csv, parse_dates, align_history,
+                              compute_family, write_csv or write) and init date, also when run on worker processes.
+                              No bytes are read by read_history when historical data is cached in memory.
+        dtype               = Optional. Numpy floating point type of the families (default float64), e.g. np.float32
+                              to halve memory use and the size of family stores (see `compute_family`).
+        float_format        = Optional. Format of values in CSV files (e.g. '%.2f'); see `write_family`.
+        pipeline            = Optional. If True, forecasts are read ahead and families are written (to CSV, writer
+                              and manifest) on background threads, while families are computed, so that disk
+                              latency overlaps with computation (see `pipeline.py`). Outputs are identical to those
+                              of a sequential run, and write errors are raised in the calling thread. Only for serial
+                              runs (n_workers=1); writes are not profiled, and profilers must not trace memory
+                              (StageProfiler(memory=False)), as peaks traced by `tracemalloc` would mix allocations
+                              of all threads.
+        queue_size          = Optional. With pipeline=True, number of forecasts read ahead, and of families waiting to
+                              be written (default 4), which bounds memory use.
 
         No output variable: output printed to file
     """
 
+    # Pipeline mode is serial, and stages overlap on several threads
+    if pipeline is True:
+        if n_workers is not None and n_workers > 1:
+            raise ValueError("pipeline mode runs in a single process: use n_workers=1")
+        if profiler is not None and profiler.memory is True:
+            raise ValueError("memory peaks cannot be traced in pipeline mode: use StageProfiler(memory=False)")
+
     # List dates for forecasts to pull
     date_list = pd.date_range(start=begin_date, end=end_date, freq='MS')
 
-    # Read historical data
-    hist_all = pd.read_csv(history_file, index_col=0)
-    hist_all.index = pd.to_datetime(np.array(hist_all.index), format='%d/%m/%Y')
+    # Read historical data, indexed for quick access to observations over each forecast period
+    with profile_stage(profiler, 'read_history', variable=variable_names[0]) as record:
+        cached = history_cached(history_file)
+        observations = observation_index(history_file, variable_names[0])
+        record['bytes_read'] = 0 if cached else os.path.getsize(history_file)
+
+    # Skip outputs that are up to date in the manifest
+    pending = None
+    if manifest is not None:
+        if writer is not None:
+            raise ValueError("a manifest can only be used with CSV outputs")
+        if isinstance(manifest, str):
+            manifest = Manifest(manifest)
+        pending = manifest.pending(date_list, history_file, forecast_folder, variable_names, 'CRPSS', skill_values,
+                                   lambda t, skill: _ensemble_output(family_folder, t, variable_names[1], skill),
+                                   output_options(dtype, float_format))
+        date_list = [t for t in date_list if t in pending]
+
+    # Pipeline on threads: read ahead, compute, and write in the background
+    if pipeline is True:
+        _ensemble_pipeline(date_list, observations, forecast_folder, variable_names, family_folder, skill_values,
+                           writer, manifest, pending, profiler, dtype, float_format, queue_size)
+        return None
+
+    # Loop on forecast dates, possibly in parallel
+    shared = {'observations': observations, 'forecast_folder': forecast_folder, 'variable_names': variable_names,
+              'family_folder': family_folder, 'skill_values': skill_values, 'to_csv': writer is None,
+              'pending': None if pending is None else {t: pending[t][0] for t in pending},
+              'profile': profiler_options(profiler), 'dtype': dtype, 'float_format': float_format}
+    for t, (result, records) in map_dates(_ensemble_family_date, date_list, shared, n_workers):
+        if profiler is not None:
+            profiler.extend(records)
+        if writer is not None:
+            family, fore_data = result
+            with profile_stage(profiler, 'write', t, variable_names[1]) as record:
+                writer.write(t, family, fore_data.index, fore_data.columns, skill_values)
+                record['bytes_written'] = family.nbytes
+        if manifest is not None:
+            manifest.record(t, variable_names[1], 'CRPSS', pending[t][0],
+                            lambda skill: _ensemble_output(family_folder, t, variable_names[1], skill), pending[t][1])
 
-    # Loop on forecast dates
-    for t in date_list:
+    return None
+
+
+def _ensemble_output(family_folder, t, variable_name, skill):
+    # Path to the CSV file of a family member written by `ecmwf_ensemble_family`
+    return family_folder + '/ECMWF_Ensemble_skill_CRPSS=' + str("%.2f" % skill) + '/' + \
+        forecast_name(t, variable_name) + '.csv'
 
-        # Read forecast data
-        fore_data = pd.read_csv(forecast_folder + '/' + str(10000*t.year + 100*t.month + t.day) + '_1d_7m_ECMWF_' +
-                                variable_names[1] + '.csv', index_col=0)
-        fore_data.index = pd.to_datetime(np.array(fore_data.index), format='%d/%m/%Y')
 
-        # Get the historical data that corresponds to the forecast period
-        hist_data = pd.Series(hist_all.loc[fore_data.index][variable_names[0]])
+def _ensemble_pipeline(date_list, observations, forecast_folder, variable_names, family_folder, skill_values, writer,
+                       manifest, pending, profiler, dtype, float_format, queue_size):
 
-        # For precipitation and evaporation: historical data needs to be turned into a cumulative sum
-        if variable_names[0] == 'Rain' or variable_names[0] == 'PET':
-            hist_data = hist_data.cumsum()
+    """
+    Generates ensemble forecast families for all init dates (see `ecmwf_ensemble_family`), reading forecasts ahead on
+    a background thread and writing families on another, through bounded queues.
+    """
 
-        # Generate forecast family after specifying outputs (True for different folders)
-        full_family_folder = family_folder + '/ECMWF_Ensemble_skill_CRPSS='
-        output_name = str(10000*t.year + 100*t.month + t.day) + '_1d_7m_ECMWF_' + variable_names[1]
-        generate_family(hist_data, fore_data, skill_values, full_family_folder, True, output_name)
+    def read(t):
+        return read_forecast(forecast_folder, t, variable_names[1], profiler)
+
+    with BackgroundWriter(queue_size) as background:
+        for t, fore_data in prefetch(read, date_list, queue_size):
+            skills = skill_values if pending is None else pending[t][0]
+
+            # Get the historical data that corresponds to the forecast period, and generate forecast family
+            with profile_stage(profiler, 'align_history', t, variable_names[1]):
+                hist_data = observations.window(fore_data.index)
+            with profile_stage(profiler, 'compute_family', t, variable_names[1]):
+                family = compute_family(hist_data, fore_data, skills, dtype=dtype)
+
+            # Queue outputs, in order, then the manifest record that they were written
+            if writer is None:
+                background.submit(write_family, family, fore_data.index, fore_data.columns, skills,
+                                  family_folder + '/ECMWF_Ensemble_skill_CRPSS=', True,
+                                  forecast_name(t, variable_names[1]), float_format)
+            else:
+                background.submit(writer.write, t, family, fore_data.index, fore_data.columns, skills)
+            if manifest is not None:
+                background.submit(manifest.record, t, variable_names[1], 'CRPSS', skills,
+                                  partial(_ensemble_output, family_folder, t, variable_names[1]), pending[t][1])
 
     return None
+
+
+def _ensemble_family_date(t, observations, forecast_folder, variable_names, family_folder, skill_values, to_csv,
+                          pending, profile, dtype, float_format):
+
+    """
+    Generates the ensemble forecast family for init date t (see `ecmwf_ensemble_family`). If `to_csv` is True, the
+    family is written to CSV files and the result is None; otherwise, the result is the family and the benchmark
+    forecast. If `pending` is not None, only the skill values it lists for init date t are generated.
+    Returns the result, and the records of a profiler created from `profile` options (None if `profile` is None).
+    """
+
+    if pending is not None:
+        skill_values = pending[t]
+    profiler = worker_profiler(profile)
+
+    # Read forecast data
+    fore_data = read_forecast(forecast_folder, t, variable_names[1], profiler)
+
+    # Get the historical data that corresponds to the forecast period (cumulative for precipitation and evaporation)
+    with profile_stage(profiler, 'align_history', t, variable_names[1]):
+        hist_data = observations.window(fore_data.index)
+
+    # Generate forecast family
+    with profile_stage(profiler, 'compute_family', t, variable_names[1]):
+        family = compute_family(hist_data, fore_data, skill_values, dtype=dtype)
+
+    # Save forecast family after specifying outputs (True for different folders), or hand it over
+    if to_csv is True:
+        with profile_stage(profiler, 'write_csv', t, variable_names[1]) as record:
+            full_family_folder = family_folder + '/ECMWF_Ensemble_skill_CRPSS='
+            output_name = forecast_name(t, variable_names[1])
+            write_family(family, fore_data.index, fore_data.columns, skill_values, full_family_folder, True,
+                         output_name, float_format)
+            if profiler is not None:
+                record['bytes_written'] = sum(os.path.getsize(_ensemble_output(family_folder, t, variable_names[1],
+                                                                               skill)) for skill in skill_values)
+        return None, worker_records(profiler)
+
+    return (family, fore_data), worker_records(profiler)
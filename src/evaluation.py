@@ -0,0 +1,208 @@
+"""
+Evaluation of forecast families in a downstream model, e.g. a reservoir operated with the forecasts, to relate
+forecast skill to the benefit it brings. Families are generated in memory (nothing is written to disk), and a
+vectorised objective is applied to all the family members of an init date at once. For instance, with a reservoir
+releasing what is forecast to flow in above a target storage:
+
+    def reservoir_objective(family, observations):
+        # family: skill x member x time, observations: time -> benefit for each skill level and member
+        release = np.clip(family - 2, 0, 10)
+        storage = np.clip(100 + np.cumsum(observations - release, axis=-1), 0, 200)
+        return -np.mean((storage - 100) ** 2, axis=-1)
+
+    table = evaluate_families(history_file, forecast_folder, ['Rain', 'Rain'], np.linspace(0, 1, 11),
+                              '1981/01/01', '2010/12/01', reservoir_objective)
+    table.groupby('skill')['benefit'].mean()       -> skill-versus-benefit curve
+"""
+
+import pandas as pd
+import numpy as np
+
+from src import deterministic, ensemble
+from src.forecasts import deterministic_forecast, read_forecast
+from src.history import observation_index
+from src.multiplier import get_metric
+from src.parallel import map_dates
+
+
+def evaluate_families(history_file, forecast_folder, variable_names, skill_values, begin_date, end_date, objective,
+                      skill_name='CRPSS', cache=None, n_workers=1):
+
+    """
+    This function evaluates the members of forecast families with a vectorised objective, over a range of init dates.
+
+    :param history_file: string, full path to file with historical data for which we have the forecasts.
+    :param forecast_folder: string, the path to the folder where the forecasts are, or a `forecasts.ForecastCube`.
+    :param variable_names: string duplet with the name of the variable both in historical data and forecasts.
+    :param skill_values: vector of floats with the skill values of the family members to evaluate.
+    :param begin_date: first init date. Format 'YYYY/MM/DD'
+    :param end_date: last init date. Format 'YYYY/MM/DD'
+    :param objective: function objective(family, observations), where family is a Numpy array (skill x member x time)
+           with all members of the family of an init date (a single member for deterministic families) and
+           observations a Numpy array (time) over the forecast period. Returns the benefit of each family member, as an
+           array (skill) or (skill x member). With n_workers > 1, it must be a module-level function.
+    :param skill_name: string, the metric upon which skill is based. Ensemble metrics (default 'CRPSS') give ensemble
+           families; deterministic metrics (e.g. 'MAE', 'MSE') give families of the ensemble average.
+    :param cache: Optional. Dictionary {(forecast variable name, skill_name, init date, skill): benefit} of results
+           already computed, e.g. from a previous call; it is updated with new results. Only pairs of init date and
+           skill missing from it are evaluated. Keys do not identify the objective, nor the data files: a cache must
+           only be shared by calls with the same objective and data.
+    :param n_workers: number of processes over which init dates are spread (default 1: serial run).
+    :return: tidy Pandas DataFrame with columns 'init_date', 'skill' (and 'member' if the objective gives a benefit per
+             member) and 'benefit', one row per init date, skill value (and member).
+    """
+
+    get_metric(skill_name)  # Fail early on unknown metrics
+    if cache is None:
+        cache = {}
+    skill_values = [float(skill) for skill in np.atleast_1d(skill_values)]
+    date_list = pd.date_range(start=begin_date, end=end_date, freq='MS')
+
+    # Evaluate (init date, skill) pairs missing from the cache only
+    key = (variable_names[1], skill_name)
+    pending = {}
+    for t in date_list:
+        missing = [skill for skill in skill_values if key + (t, skill) not in cache]
+        if len(missing) > 0:
+            pending[t] = missing
+
+    shared = {'observations': observation_index(history_file, variable_names[0]), 'forecast_folder': forecast_folder,
+              'variable_names': variable_names, 'skill_name': skill_name, 'objective': objective, 'pending': pending}
+    for t, benefit in map_dates(_evaluate_date, list(pending), shared, n_workers):
+        for skill, value in zip(pending[t], benefit):
+            cache[key + (t, skill)] = value
+
+    # Tidy table, one row per init date and skill value, or per init date, skill value and member
+    rows = []
+    for t in date_list:
+        for skill in skill_values:
+            value = np.asarray(cache[key + (t, skill)])
+            if value.ndim == 0:
+                rows.append((t, skill, float(value)))
+            else:
+                rows.extend((t, skill, j, float(value[j])) for j in range(len(value)))
+    columns = ['init_date', 'skill', 'benefit'] if len(rows) == 0 or len(rows[0]) == 3 else \
+        ['init_date', 'skill', 'member', 'benefit']
+
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _evaluate_date(t, observations, forecast_folder, variable_names, skill_name, objective, pending):
+
+    """
+    Generates the family of init date t for the skill values pending evaluation, and evaluates it (see
+    `evaluate_families`). Returns the benefit of each family member, as a Numpy array (skill) or (skill x member).
+    """
+
+    skill_values = pending[t]
+    fore_data = read_forecast(forecast_folder, t, variable_names[1])
+    hist_data = observations.window(fore_data.index)
+
+    # Whole family in memory, as a batch (skill x member x time)
+    if get_metric(skill_name)['ensemble'] is True:
+        family = ensemble.compute_family(hist_data, fore_data, skill_values, skill_name)
+    else:
+        benchmark = deterministic_forecast(fore_data, variable_names[1])
+        family = deterministic.compute_family(hist_data, benchmark, skill_values, skill_name)[..., np.newaxis]
+    batch = np.ascontiguousarray(family.transpose(0, 2, 1))
+
+    benefit = np.asarray(objective(batch, np.asarray(hist_data, dtype=float)), dtype=float)
+    if benefit.ndim not in [1, 2] or benefit.shape[0] != len(skill_values):
+        raise ValueError("objective must return an array (skill) or (skill x member)")
+
+    return benefit
+
+
+def refine_skill_grid(history_file, forecast_folder, variable_names, begin_date, end_date, objective,
+                      skill_name='CRPSS', threshold=None, initial_skill=(0, 0.25, 0.5, 0.75, 1), tolerance=0.01,
+                      change_tolerance=0.05, max_levels=40, cache=None, n_workers=1):
+
+    """
+    This function finds how the benefit of family members (see `evaluate_families`) responds to skill, evaluating
+    families at a few skill levels only: it starts from a coarse grid, and only refines the intervals of interest.
+        - With a threshold, intervals where the benefit crosses the threshold are refined by guarded linear
+          interpolation (falling back to the interval's central half), until they are narrower than `tolerance`.
+        - Without a threshold, intervals are split in two until the benefit in their middle is within
+          `change_tolerance` times its range of the linear interpolation between their ends (or they are narrower
+          than `tolerance`), so that levels concentrate where the benefit changes most (e.g. where it saturates).
+    All intervals to refine are evaluated together in each round, and evaluated levels are cached.
+
+    :param history_file: string, full path to file with historical data for which we have the forecasts.
+    :param forecast_folder: string, the path to the folder where the forecasts are, or a `forecasts.ForecastCube`.
+    :param variable_names: string duplet with the name of the variable both in historical data and forecasts.
+    :param begin_date: first init date. Format 'YYYY/MM/DD'
+    :param end_date: last init date. Format 'YYYY/MM/DD'
+    :param objective: vectorised objective, see `evaluate_families`. The response to skill is its benefit averaged
+           over init dates (and members).
+    :param skill_name: string, the metric upon which skill is based (default 'CRPSS').
+    :param threshold: float, benefit whose crossing is sought (default None: refine where benefit changes fastest).
+    :param initial_skill: vector of floats with the coarse grid of skill values evaluated first.
+    :param tolerance: float, width of skill intervals under which they are no longer refined.
+    :param change_tolerance: float, without threshold, tolerance on linear interpolation of benefit (relative to the
+           range of benefit) under which intervals are no longer refined.
+    :param max_levels: int, maximum number of skill levels evaluated.
+    :param cache: Optional. Dictionary of results already computed, see `evaluate_families`. It is passed on to each
+           call of `evaluate_families`, so it must only be shared by runs with the same objective and data.
+    :param n_workers: number of processes over which init dates are spread (default 1: serial run).
+    :return: Pandas Series with the benefit at each evaluated skill level, indexed by increasing skill.
+    """
+
+    if cache is None:
+        cache = {}
+    args = (history_file, forecast_folder, variable_names)
+    dates = (begin_date, end_date)
+
+    def response(skill_values):
+        table = evaluate_families(*args, skill_values, *dates, objective, skill_name, cache, n_workers)
+        return table.groupby('skill')['benefit'].mean()
+
+    curve = response(sorted(set(float(skill) for skill in initial_skill)))
+    settled = set()  # Intervals over which benefit was found to be linear
+    while len(curve) < max_levels:
+        skill, benefit = curve.index.values, curve.values
+        width = np.diff(skill)
+
+        # Next levels, in intervals crossing the threshold, or in the middle of intervals not known to be linear
+        if threshold is not None:
+            below = benefit - threshold
+            refined = np.flatnonzero((below[:-1] * below[1:] < 0) & (width > tolerance))
+            interpolated = skill[refined] + width[refined] * below[refined] / (below[refined] - below[refined + 1])
+            new_levels = np.clip(interpolated, skill[refined] + width[refined] / 4,
+                                 skill[refined + 1] - width[refined] / 4)
+        else:
+            refined = np.array([i for i in range(len(width)) if width[i] > tolerance and
+                                (skill[i], skill[i + 1]) not in settled], dtype=int)
+            new_levels = skill[refined] + width[refined] / 2
+
+        refined, new_levels = refined[:max_levels - len(curve)], new_levels[:max_levels - len(curve)]
+        if len(new_levels) == 0:
+            break
+        curve = response(skill.tolist() + new_levels.tolist())
+
+        # Intervals whose middle is close to the linear interpolation of their ends are not refined further
+        if threshold is None:
+            linear = (benefit[refined] + benefit[refined + 1]) / 2
+            deviation = np.abs(curve.loc[new_levels].values - linear)
+            for i, level, small in zip(refined, new_levels, deviation <= change_tolerance * np.ptp(curve.values)):
+                if small:
+                    settled.update([(skill[i], level), (level, skill[i + 1])])
+
+    return curve.sort_index()
+
+
+def crossing_skill(curve, threshold):
+
+    """
+    This function estimates the skill values at which benefit crosses a threshold, by linear interpolation.
+
+    :param curve: Pandas Series with benefit indexed by increasing skill, e.g. from `refine_skill_grid`.
+    :param threshold: float, benefit threshold.
+    :return: list of skill values where the benefit crosses the threshold.
+    """
+
+    skill, below = curve.index.values, curve.values - threshold
+    crossings = skill[below == 0].tolist()
+    for i in np.flatnonzero(below[:-1] * below[1:] < 0):
+        crossings.append(skill[i] + (skill[i + 1] - skill[i]) * below[i] / (below[i] - below[i + 1]))
+
+    return sorted(crossings)
@@ -0,0 +1,226 @@
+"""
+Access to benchmark forecasts stored as one CSV file per init date and variable, named after the ECMWF hindcast files
+used in the paper: YYYYMMDD_1d_7m_ECMWF_<variable>.csv, with dates in format DD/MM/YYYY as first column, and one column
+per ensemble member.
+
+A folder of such files can be ingested once into a forecast cube: for each variable, a single binary array
+(init date x lead day x member) that is memory-mapped when read. Wherever a forecast folder is expected (e.g. in the
+ECMWF family drivers), a `ForecastCube` can be given instead, so that CSV files are never parsed again.
+"""
+
+import pandas as pd
+import numpy as np
+import hashlib
+import os
+import warnings
+
+from src.history import file_hash
+from src.profiling import profile_stage
+
+CUBE_INDEX_SUFFIX = '.index.npz'
+
+
+def forecast_name(t, variable_name):
+
+    """Common part of the names of files holding forecasts (and their families) issued at date t for a variable."""
+
+    return str(10000*t.year + 100*t.month + t.day) + '_1d_7m_ECMWF_' + variable_name
+
+
+def forecast_path(forecast_folder, t, variable_name):
+
+    """Path to the file holding the forecast of a variable issued at date t."""
+
+    return forecast_folder + '/' + forecast_name(t, variable_name) + '.csv'
+
+
+def read_forecast(forecast_folder, t, variable_name, profiler=None):
+
+    """
+    This function reads the ensemble forecast of a variable issued at date t.
+
+    :param forecast_folder: string, the path to the folder where the forecasts are, or a ForecastCube.
+    :param t: init date of the forecast.
+    :param variable_name: string, the name of the variable in the forecasts.
+    :param profiler: Optional. `profiling.StageProfiler` recording the 'read_csv' and 'parse_dates' stages (or
+           'read_cube' for a forecast cube).
+    :return: Pandas DataFrame (lead date x member) with a DatetimeIndex.
+    """
+
+    if isinstance(forecast_folder, ForecastCube):
+        with profile_stage(profiler, 'read_cube', t, variable_name) as record:
+            fore_data = forecast_folder.forecast(t, variable_name)
+            record['bytes_read'] = fore_data.values.nbytes
+        return fore_data
+
+    path = forecast_path(forecast_folder, t, variable_name)
+    with profile_stage(profiler, 'read_csv', t, variable_name, os.path.getsize(path) if profiler is not None else 0):
+        fore_data = pd.read_csv(path, index_col=0)
+    with profile_stage(profiler, 'parse_dates', t, variable_name):
+        fore_data.index = pd.to_datetime(np.array(fore_data.index), format='%d/%m/%Y')
+
+    return fore_data
+
+
+def deterministic_forecast(fore_data, variable_name):
+
+    """Deterministic forecast defined as the ensemble average of `fore_data`, as a Pandas Series."""
+
+    return pd.Series(data=fore_data.mean(axis=1), index=fore_data.index, name='Forecast ' + variable_name + ': average')
+
+
+def forecast_hash(forecast_folder, t, variable_name):
+
+    """SHA-256 hash of the forecast of a variable issued at date t (of its file, or of its values in a cube)."""
+
+    if isinstance(forecast_folder, ForecastCube):
+        values = np.ascontiguousarray(forecast_folder.forecast(t, variable_name).values)
+        return hashlib.sha256(values.tobytes()).hexdigest()
+
+    return file_hash(forecast_path(forecast_folder, t, variable_name))
+
+
+def ingest_forecasts(forecast_folder, variable_names, begin_date, end_date, cube_folder):
+
+    """
+    This function reads monthly forecast CSV files once, and saves them as a forecast cube. For each variable, the cube
+    holds a binary array (init date x lead day x member) in `<variable>.npy`, padded with NaN where forecasts are
+    shorter than the longest one, and an index (init dates, forecast lengths, members) in `<variable>.index.npz`.
+    Init dates without a forecast file are left out of the cube of the variable, with a warning.
+
+    :param forecast_folder: string, the path to the folder where the forecast CSV files are.
+    :param variable_names: list of strings, the names of the variables in the forecasts (e.g. ['Rain', 'Temp']).
+    :param begin_date: first init date. Format 'YYYY/MM/DD'
+    :param end_date: last init date. Format 'YYYY/MM/DD'
+    :param cube_folder: string, folder where to save the cube.
+    :return: ForecastCube reading the cube.
+    """
+
+    date_list = pd.date_range(start=begin_date, end=end_date, freq='MS')
+    if os.path.exists(cube_folder) is False:
+        os.makedirs(cube_folder)
+
+    for variable_name in variable_names:
+
+        # Read all forecasts there are, checking that they are daily
+        forecasts, init_dates, missing = [], [], []
+        for t in date_list:
+            if os.path.exists(forecast_path(forecast_folder, t, variable_name)) is False:
+                missing.append(t.strftime('%Y-%m-%d'))
+                continue
+            fore_data = read_forecast(forecast_folder, t, variable_name)
+            if len(fore_data) > 1 and np.any(np.diff(fore_data.index.values) != np.timedelta64(1, 'D')):
+                raise ValueError("forecast " + forecast_path(forecast_folder, t, variable_name) + " is not daily")
+            forecasts.append(fore_data)
+            init_dates.append(t)
+        if len(forecasts) == 0:
+            raise FileNotFoundError("no forecast of " + variable_name + " in " + forecast_folder + " between " +
+                                    str(begin_date) + " and " + str(end_date))
+        if len(missing) > 0:
+            warnings.warn("no forecast of " + variable_name + " issued on " + ', '.join(missing) +
+                          ": init dates left out of the forecast cube")
+        members = forecasts[0].columns
+        if any(not fore_data.columns.equals(members) for fore_data in forecasts):
+            raise ValueError("all forecasts of " + variable_name + " must have the same members")
+
+        # One array for all init dates
+        lead_counts = np.array([len(fore_data) for fore_data in forecasts], dtype=np.int64)
+        values = np.lib.format.open_memmap(os.path.join(cube_folder, variable_name + '.npy'), mode='w+', dtype=float,
+                                           shape=(len(forecasts), int(lead_counts.max()), len(members)))
+        values[:] = np.nan
+        for i in range(len(forecasts)):
+            values[i, :lead_counts[i], :] = forecasts[i].values
+        values.flush()
+        del values
+
+        np.savez(os.path.join(cube_folder, variable_name + CUBE_INDEX_SUFFIX),
+                 init_dates=pd.DatetimeIndex(init_dates).values,
+                 first_lead_dates=np.array([fore_data.index.values[0] for fore_data in forecasts]),
+                 lead_counts=lead_counts, members=np.array([str(m) for m in members]))
+
+    return ForecastCube(cube_folder)
+
+
+class ForecastCube:
+
+    """
+    Reads a forecast cube written by `ingest_forecasts`. Forecasts are views of memory-mapped arrays (no parsing):
+
+        cube = ForecastCube('data/ECMWF forecasts cube')
+        cube.forecast('2011/11/01', 'Rain')      -> Pandas DataFrame (lead date x member)
+        cube.values('Rain')                     -> Numpy array (init date x lead day x member)
+    """
+
+    def __init__(self, cube_folder):
+
+        """
+        :param cube_folder: string, folder of the forecast cube.
+        """
+
+        self.cube_folder = cube_folder
+        self.variables = sorted(file[:-len(CUBE_INDEX_SUFFIX)] for file in os.listdir(cube_folder)
+                                if file.endswith(CUBE_INDEX_SUFFIX))
+        self._indexes = {}
+        self._values = {}
+
+    def __getstate__(self):
+        # Memory maps are opened again, rather than copied, when a cube is sent to another process
+        return {'cube_folder': self.cube_folder, 'variables': self.variables, '_indexes': {}, '_values': {}}
+
+    def _index(self, variable_name):
+        if variable_name not in self._indexes:
+            if variable_name not in self.variables:
+                raise KeyError("variable not in forecast cube: " + str(variable_name))
+            with np.load(os.path.join(self.cube_folder, variable_name + CUBE_INDEX_SUFFIX)) as index:
+                self._indexes[variable_name] = {'init_dates': pd.DatetimeIndex(index['init_dates']),
+                                                'first_lead_dates': index['first_lead_dates'],
+                                                'lead_counts': index['lead_counts'],
+                                                'members': pd.Index(index['members'])}
+        return self._indexes[variable_name]
+
+    def init_dates(self, variable_name):
+
+        """Init dates of the forecasts of a variable."""
+
+        return self._index(variable_name)['init_dates']
+
+    def members(self, variable_name):
+
+        """Names of the ensemble members of the forecasts of a variable."""
+
+        return self._index(variable_name)['members']
+
+    def values(self, variable_name):
+
+        """All forecasts of a variable, as a read-only Numpy array (init date x lead day x member) mapped on disk."""
+
+        if variable_name not in self._values:
+            self._index(variable_name)
+            self._values[variable_name] = np.load(os.path.join(self.cube_folder, variable_name + '.npy'), mmap_mode='r')
+
+        return self._values[variable_name]
+
+    def _position(self, t, variable_name):
+        position = self.init_dates(variable_name).get_indexer([pd.Timestamp(t)])[0]
+        if position < 0:
+            raise KeyError("no forecast of " + variable_name + " issued on " + str(t) + " in forecast cube")
+        return position
+
+    def lead_dates(self, t, variable_name):
+
+        """Dates of the forecast of a variable issued at date t."""
+
+        index = self._index(variable_name)
+        position = self._position(t, variable_name)
+
+        return pd.date_range(index['first_lead_dates'][position], periods=index['lead_counts'][position], freq='D')
+
+    def forecast(self, t, variable_name):
+
+        """Forecast of a variable issued at date t, as a Pandas DataFrame (lead date x member)."""
+
+        position = self._position(t, variable_name)
+        values = self.values(variable_name)[position, :self._index(variable_name)['lead_counts'][position], :]
+
+        return pd.DataFrame(data=values, index=self.lead_dates(t, variable_name), columns=self.members(variable_name),
+                            copy=False)
@@ -0,0 +1,251 @@
+"""
+Cached access to historical climate files (CSV files with dates in format DD/MM/YYYY as first column, and one column
+per variable, e.g. 'Rain', 'Temp', 'PET'). Each file is parsed once per process and kept in memory; the cached copy
+is discarded as soon as the file is modified. Optionally, parsed data is also saved to a binary sidecar file next to
+the CSV file, so that other processes (and later sessions) skip CSV parsing too.
+"""
+
+import pandas as pd
+import numpy as np
+import hashlib
+import os
+
+SIDECAR_SUFFIX = '.history.npz'
+
+# Parsed historical data, by absolute file path: (file signature, DataFrame)
+_cache = {}
+
+
+def file_hash(path):
+
+    """SHA-256 hash of the contents of a file."""
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _signature(path, check_hash):
+    # What identifies a version of the file: modification time and size, plus content hash if requested
+    status = os.stat(path)
+    return status.st_mtime_ns, status.st_size, file_hash(path) if check_hash else None
+
+
+def _parse(history_file):
+    hist_all = pd.read_csv(history_file, index_col=0)
+    hist_all.index = pd.to_datetime(np.array(hist_all.index), format='%d/%m/%Y')
+    return hist_all.sort_index()
+
+
+def _read_sidecar(sidecar_file, signature):
+    if os.path.exists(sidecar_file) is False:
+        return None
+    with np.load(sidecar_file) as sidecar:
+        if tuple(sidecar['signature'][:2].astype(np.int64)) != signature[:2]:
+            return None
+        if signature[2] is not None and str(sidecar['hash']) != signature[2]:
+            return None
+        columns = [str(c) for c in sidecar['columns']]
+        data = {columns[j]: sidecar['column_' + str(j)] for j in range(len(columns))}
+        return pd.DataFrame(data, index=pd.DatetimeIndex(sidecar['dates'], name=str(sidecar['index_name']) or None))
+
+
+def _write_sidecar(path, signature, hist_all):
+    columns = {'column_' + str(j): hist_all.iloc[:, j].to_numpy() for j in range(hist_all.shape[1])}
+    if any(c.dtype == object for c in columns.values()):
+        return None  # Only numerical data is saved
+    np.savez(path + SIDECAR_SUFFIX, signature=np.array(signature[:2], dtype=np.int64),
+             hash=np.array(signature[2] if signature[2] is not None else file_hash(path)),
+             dates=hist_all.index.values, columns=np.array([str(c) for c in hist_all.columns]),
+             index_name=np.array(hist_all.index.name or ''), **columns)
+    return None
+
+
+def _is_cached(path, signature):
+    # Whether the cached data of a file (absolute path) is that of its version with this signature
+    if path not in _cache:
+        return False
+    cached_signature = _cache[path][0]
+    return cached_signature[:2] == signature[:2] and (signature[2] is None or cached_signature[2] == signature[2])
+
+
+def history_cached(history_file, check_hash=False):
+
+    """True if reading a historical climate file would return its data cached in memory, without reading the file."""
+
+    path = os.path.abspath(history_file)
+
+    return _is_cached(path, _signature(path, check_hash))
+
+
+def read_history(history_file, sidecar=False, check_hash=False):
+
+    """
+    This function reads a historical climate file into a Pandas DataFrame with a sorted DatetimeIndex. Results are
+    cached: the file is only parsed again if it changed since last read.
+
+    :param history_file: string, the path to the historical data (CSV, dates in format DD/MM/YYYY in first column).
+    :param sidecar: boolean, if True read from (and save to) a binary copy of the parsed data next to the CSV file.
+    :param check_hash: boolean, if True also compare file contents (SHA-256) to detect changes, not only the
+           modification time and size of the file.
+    :return: Pandas DataFrame with the historical data. It is shared with later calls: do not modify it in place.
+    """
+
+    path = os.path.abspath(history_file)
+    signature = _signature(path, check_hash)
+
+    # Cached in memory
+    if _is_cached(path, signature):
+        return _cache[path][1]
+
+    # Read from binary sidecar, or parse CSV file
+    hist_all = None
+    if sidecar is True:
+        hist_all = _read_sidecar(path + SIDECAR_SUFFIX, signature)
+    if hist_all is None:
+        hist_all = _parse(path)
+        if sidecar is True:
+            _write_sidecar(path, signature, hist_all)
+
+    _cache[path] = (signature, hist_all)
+
+    return hist_all
+
+
+def clear_history_cache():
+
+    """Empties the in-memory cache of historical data."""
+
+    _cache.clear()
+    _index_cache.clear()
+
+    return None
+
+
+# Variables observed as daily amounts, but forecast as amounts accumulated since the forecast init date
+CUMULATIVE_VARIABLES = ['Rain', 'PET']
+
+
+class ObservationIndex:
+
+    """
+    Fast access to the observations over forecast windows. For cumulative variables (see `CUMULATIVE_VARIABLES`),
+    observations accumulated since the start of a window are differences of two values of a prefix sum computed once
+    over the whole record, instead of a new cumulative sum for every window.
+
+    Dates missing from the record, and missing values (NaN), are NaN in the outputs. Like a cumulative sum in Pandas,
+    the accumulation skips them and carries on with the next available values.
+    """
+
+    def __init__(self, observations, cumulative=False):
+
+        """
+        :param observations: Pandas Series with the observations, with a DatetimeIndex.
+        :param cumulative: boolean, if True observations are accumulated from the start of each forecast window.
+        """
+
+        observations = observations.sort_index()
+        self.name = observations.name
+        self.cumulative = cumulative
+        self._dates = observations.index.values
+        self._values = observations.to_numpy(dtype=float)
+
+        # Prefix sum: self._prefix[i] is the sum of the first i values, missing values counting as zero
+        self._prefix = np.concatenate([[0.0], np.cumsum(np.nan_to_num(self._values, nan=0.0))])
+
+    @classmethod
+    def from_history(cls, hist_all, var_name):
+
+        """Index of variable `var_name` in historical data `hist_all`, cumulative for rainfall and evaporation."""
+
+        return cls(hist_all[var_name], cumulative=var_name in CUMULATIVE_VARIABLES)
+
+    def _positions(self, dates):
+        # Position of each date in the record, and whether it is there
+        dates = np.asarray(dates, dtype=self._dates.dtype)
+        positions = np.searchsorted(self._dates, dates)
+        found = positions < len(self._dates)
+        found[found] = self._dates[positions[found]] == dates[found]
+        return dates, positions, found
+
+    def window(self, dates, missing='raise'):
+
+        """
+        Observations over one forecast window.
+
+        :param dates: dates of the forecast (e.g. a DatetimeIndex), in increasing order.
+        :param missing: string, 'raise' to raise a KeyError if dates are missing from the record, 'nan' to return NaN.
+        :return: Pandas Series indexed by `dates`.
+        """
+
+        dates, positions, found = self._positions(dates)
+        if missing == 'raise' and not np.all(found):
+            raise KeyError("dates missing from historical data: " + str(pd.DatetimeIndex(dates[~found])))
+
+        values = np.full(len(dates), np.nan)
+        if self.cumulative is False:
+            values[found] = self._values[positions[found]]
+        elif len(dates) > 0:
+            # Contiguous window in the record: difference of prefix sums. Otherwise sum the requested values only.
+            start = np.searchsorted(self._dates, dates[0], side='left')
+            stop = np.searchsorted(self._dates, dates[-1], side='right')
+            if stop - start == np.count_nonzero(found):
+                values[found] = self._prefix[positions[found] + 1] - self._prefix[start]
+            else:
+                values[found] = np.cumsum(np.nan_to_num(self._values[positions[found]], nan=0.0))
+            values[found & np.isnan(self._values[np.minimum(positions, len(self._values) - 1)])] = np.nan
+
+        return pd.Series(data=values, index=pd.DatetimeIndex(dates), name=self.name)
+
+    def windows(self, start_dates, length):
+
+        """
+        Observations over many daily forecast windows at once.
+
+        :param start_dates: init dates of the forecasts.
+        :param length: number of days in each forecast window.
+        :return: 2-D Numpy array (window x lead day), NaN where dates or values are missing.
+        """
+
+        starts = pd.DatetimeIndex(start_dates).values.astype(self._dates.dtype)
+        dates = starts[:, np.newaxis] + np.arange(length).astype('timedelta64[D]')[np.newaxis, :]
+        _, positions, found = self._positions(dates.reshape(-1))
+        positions = positions.reshape(dates.shape)
+        found = found.reshape(dates.shape)
+
+        values = np.full(dates.shape, np.nan)
+        safe_positions = np.minimum(positions, len(self._values) - 1)
+        if self.cumulative is False:
+            values[found] = self._values[safe_positions[found]]
+        else:
+            # Daily windows are contiguous: every record date inside a window is one of its dates
+            window_starts = np.searchsorted(self._dates, starts)
+            values[found] = (self._prefix[safe_positions + 1] - self._prefix[window_starts][:, np.newaxis])[found]
+            values[found & np.isnan(self._values[safe_positions])] = np.nan
+
+        return values
+
+
+# Observation indexes, by (absolute file path, variable name): (historical data they were built from, index)
+_index_cache = {}
+
+
+def observation_index(history_file, var_name):
+
+    """
+    This function returns the `ObservationIndex` of a variable in a historical climate file. Like historical data, it
+    is cached and only computed again if the file changed.
+
+    :param history_file: string, the path to the historical data.
+    :param var_name: string, the name of the variable in historical data.
+    :return: ObservationIndex, cumulative for rainfall and evaporation.
+    """
+
+    hist_all = read_history(history_file)
+    key = (os.path.abspath(history_file), var_name)
+    if key not in _index_cache or _index_cache[key][0] is not hist_all:
+        _index_cache[key] = (hist_all, ObservationIndex.from_history(hist_all, var_name))
+
+    return _index_cache[key][1]
@@ -0,0 +1,131 @@
+"""
+Manifest of the outputs of family runs, so that runs can be resumed or extended without generating again what is
+already there. Each output (one init date, variable, metric and skill value) is recorded with hashes of the forecast
+and historical data it was generated from. An output is up to date if it is in the manifest, its file exists, and its
+inputs did not change since.
+
+The manifest is a text file with one JSON record per line. Records are appended as soon as outputs are written, so
+that an interrupted run loses nothing; when an output is recorded several times, the last record prevails.
+"""
+
+import pandas as pd
+import numpy as np
+import json
+import os
+
+from src.forecasts import forecast_hash
+from src.history import file_hash
+
+
+class Manifest:
+
+    def __init__(self, path):
+
+        """
+        :param path: string, the path to the manifest file. It is created on first record if it does not exist.
+        """
+
+        self.path = path
+        self._records = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip() == '':
+                        continue
+                    record = json.loads(line)
+                    self._records[self.key(record['init_date'], record['variable'], record['metric'],
+                                           record['skill'])] = record
+
+    def __len__(self):
+        return len(self._records)
+
+    @staticmethod
+    def key(init_date, variable, metric, skill):
+        """Key of an output in the manifest."""
+        return pd.Timestamp(init_date).strftime('%Y-%m-%d'), variable, metric, repr(float(skill))
+
+    def is_current(self, init_date, variable, metric, skill, output, inputs):
+
+        """
+        True if the output is recorded, still exists, and was generated from the same inputs.
+
+        :param output: string, the path to the output file.
+        :param inputs: dictionary describing the inputs (e.g. hashes of forecast and historical data).
+        """
+
+        record = self._records.get(self.key(init_date, variable, metric, skill))
+
+        return record is not None and record['output'] == output and record['inputs'] == inputs and \
+            os.path.exists(output)
+
+    def record(self, init_date, variable, metric, skill_values, output, inputs):
+
+        """
+        Records outputs for an init date, variable and metric, and for one or several skill values.
+
+        :param skill_values: float or vector of floats with the skill values.
+        :param output: string, the path to the output file, or function of the skill value giving that path.
+        :param inputs: dictionary describing the inputs (e.g. hashes of forecast and historical data).
+        """
+
+        with open(self.path, 'a') as f:
+            for skill in np.atleast_1d(np.asarray(skill_values, dtype=float)).tolist():
+                record = {'init_date': pd.Timestamp(init_date).strftime('%Y-%m-%d'), 'variable': variable,
+                          'metric': metric, 'skill': float(skill),
+                          'output': output(skill) if callable(output) else output, 'inputs': inputs}
+                f.write(json.dumps(record) + '\n')
+                self._records[self.key(init_date, variable, metric, skill)] = record
+
+        return None
+
+    def pending(self, date_list, history_file, forecast_folder, variable_names, metric, skill_values, output,
+                options=None):
+
+        """
+        This function lists the outputs of a family run that are missing or out of date.
+
+        :param date_list: init dates of the run.
+        :param history_file: string, the path to the historical data.
+        :param forecast_folder: string, the path to the folder where the forecasts are, or a `forecasts.ForecastCube`.
+        :param variable_names: string duplet with the name of the variable both in historical data and forecasts.
+        :param metric: string, the metric upon which skill is based.
+        :param skill_values: vector of floats with the skill values of the run.
+        :param output: function output(t, skill) giving the path to the output file for init date t and a skill value.
+        :param options: Optional. Dictionary of generation options that outputs depend on (see `output_options`),
+               recorded with the inputs, so that changing them generates outputs again.
+        :return: dictionary {init date: (list of pending skill values, inputs)}, for init dates with pending outputs.
+        """
+
+        history_hash = file_hash(history_file)
+        pending = {}
+        for t in date_list:
+            inputs = {'forecast_hash': forecast_hash(forecast_folder, t, variable_names[1]),
+                      'history_hash': history_hash, 'history_variable': variable_names[0]}
+            if options:
+                inputs.update(options)
+            missing = [skill for skill in skill_values
+                       if not self.is_current(t, variable_names[1], metric, skill, output(t, skill), inputs)]
+            if len(missing) > 0:
+                pending[t] = (missing, inputs)
+
+        return pending
+
+
+def output_options(dtype=None, float_format=None):
+
+    """
+    Generation options that family outputs depend on, to be recorded in a manifest. Default options (float64 values,
+    default CSV format) are left out, so that manifests written without options remain valid for default runs.
+
+    :param dtype: Numpy floating point type of the families (None for float64).
+    :param float_format: string, format of values in CSV files (None for the default format).
+    :return: dictionary of the options that differ from the default.
+    """
+
+    options = {}
+    if dtype is not None and np.dtype(dtype) != np.float64:
+        options['dtype'] = np.dtype(dtype).name
+    if float_format is not None:
+        options['float_format'] = float_format
+
+    return options
@@ -0,0 +1,283 @@
+"""
+Conversion of skill values into the multipliers k used to build forecast family members, where each member is
+(1 - k) * observations + k * benchmark.
+
+Skill is always relative to the benchmark: skill = (score - benchmark score) / (perfect score - benchmark score), so
+that the benchmark (k = 1) has skill 0 and the observations (k = 0) have skill 1. Metrics are kept in a registry. Some
+have a closed-form multiplier; for the others, k is found numerically, by bisection on all skill values (and all
+forecasts) at once, which assumes that skill decreases as k increases.
+"""
+
+import numpy as np
+import hashlib
+
+from src.verification import crps
+
+# Multipliers solved numerically, by (metric, observations, benchmark) key: {skill value: k}
+_cache = {}
+
+
+def _mae(forecast, observations):
+    return np.nanmean(np.abs(forecast - observations), axis=-1)
+
+
+def _mse(forecast, observations):
+    return np.nanmean((forecast - observations) ** 2, axis=-1)
+
+
+def _rmse(forecast, observations):
+    return np.sqrt(_mse(forecast, observations))
+
+
+def _nse(forecast, observations):
+    # Nash-Sutcliffe efficiency
+    variance = np.nanmean((observations - np.nanmean(observations, axis=-1, keepdims=True)) ** 2, axis=-1)
+    return 1 - _mse(forecast, observations) / variance
+
+
+def _kge(forecast, observations):
+    # Kling-Gupta efficiency, from correlation, variability ratio and bias ratio
+    forecast, observations = np.broadcast_arrays(forecast, observations)
+    forecast_anomaly = forecast - np.nanmean(forecast, axis=-1, keepdims=True)
+    observed_anomaly = observations - np.nanmean(observations, axis=-1, keepdims=True)
+    forecast_std = np.sqrt(np.nanmean(forecast_anomaly ** 2, axis=-1))
+    observed_std = np.sqrt(np.nanmean(observed_anomaly ** 2, axis=-1))
+    r = np.nanmean(forecast_anomaly * observed_anomaly, axis=-1) / (forecast_std * observed_std)
+    alpha = forecast_std / observed_std
+    beta = np.nanmean(forecast, axis=-1) / np.nanmean(observations, axis=-1)
+    return 1 - np.sqrt((r - 1) ** 2 + (alpha - 1) ** 2 + (beta - 1) ** 2)
+
+
+def _crps(forecast, observations):
+    return np.nanmean(crps(forecast, observations), axis=-1)
+
+
+def transformed(score, transform):
+
+    """
+    This function makes a score computed on transformed data, e.g. `transformed(score, np.log1p)` for log flows.
+
+    :param score: function score(forecast, observations) reducing the time axis (last axis).
+    :param transform: vectorised function applied to both forecast and observations.
+    :return: function score(forecast, observations) on transformed data.
+    """
+
+    def transformed_score(forecast, observations):
+        return score(transform(forecast), transform(observations))
+
+    return transformed_score
+
+
+def clear_multiplier_cache(skill_name=None):
+
+    """Forgets multipliers solved numerically, for one metric or (by default) for all metrics."""
+
+    for key in list(_cache):
+        if skill_name is None or key[0] == skill_name:
+            del _cache[key]
+
+    return None
+
+
+# Registered metrics, by name: dictionary with keys
+#     'score'      = function score(forecast, observations) -> score, reducing the time axis (and member axis for
+#                    ensembles); forecasts may have extra leading axes
+#     'perfect'    = score of a perfect forecast
+#     'ensemble'   = True if forecasts have a member axis (last axis, after the time axis)
+#     'multiplier' = None, or closed-form function of the skill values giving k
+METRICS = {}
+
+
+def register_metric(name, score, perfect, ensemble=False, multiplier=None):
+
+    """
+    This function adds a metric upon which skill can be based, or replaces an existing one.
+
+    :param name: string, the name of the metric (e.g. 'KGE').
+    :param score: function score(forecast, observations). Forecasts have the shape of observations (... x time),
+           possibly with extra leading axes, and for ensembles an extra member axis (... x time x member). Returns the
+           score of each forecast, reducing the time (and member) axes.
+    :param perfect: float, the score of a perfect forecast (e.g. 0 for errors, 1 for efficiencies).
+    :param ensemble: boolean, True if the metric applies to ensemble forecasts.
+    :param multiplier: None, or closed-form function giving k from a Numpy array of skill values.
+    :return: None
+    """
+
+    METRICS[name] = {'score': score, 'perfect': perfect, 'ensemble': ensemble, 'multiplier': multiplier}
+    clear_multiplier_cache(name)
+
+    return None
+
+
+def get_metric(skill_name):
+
+    """Registered metric `skill_name`; raises a ValueError if there is no such metric."""
+
+    if skill_name not in METRICS:
+        raise ValueError("skill name must be a string with values in " + str(sorted(METRICS)))
+
+    return METRICS[skill_name]
+
+
+def _mse_multiplier(skill):
+    if np.any(skill > 1):
+        raise ValueError("MSE-based skill values cannot exceed 1")
+    return np.sqrt(1 - skill)
+
+
+register_metric('CRPSS', _crps, 0, ensemble=True, multiplier=lambda skill: 1 - skill)
+register_metric('MAE', _mae, 0, multiplier=lambda skill: 1 - skill)
+register_metric('MSE', _mse, 0, multiplier=_mse_multiplier)
+register_metric('RMSE', _rmse, 0, multiplier=lambda skill: 1 - skill)
+register_metric('NSE', _nse, 1, multiplier=_mse_multiplier)
+register_metric('KGE', _kge, 1)
+register_metric('logNSE', transformed(_nse, np.log1p), 1)
+
+
+def skill_to_multiplier(skill_values, skill_name):
+
+    """
+    This function converts skill values into multipliers k, for metrics with a closed-form multiplier.
+
+    :param skill_values: vector of floats with the values of the skill that family members should have.
+    :param skill_name: string, the name of the metric upon which skill is based (e.g. 'CRPSS', 'MAE' or 'MSE').
+    :return: 1-D Numpy array with the multiplier k for each skill value.
+    """
+
+    metric = get_metric(skill_name)
+    if metric['multiplier'] is None:
+        raise ValueError("no closed-form multiplier for " + skill_name + ": use `solve_multiplier`")
+
+    return metric['multiplier'](np.asarray(skill_values, dtype=float).reshape(-1))
+
+
+def blend(k, observations, benchmark, ensemble, dtype=None):
+
+    """
+    This function builds family members (1 - k) * observations + k * benchmark, for all multipliers at once.
+
+    :param k: Numpy array (n) or (n x ...) of multipliers, with one value per skill level (and per forecast).
+    :param observations: Numpy array (... x time) with the observations.
+    :param benchmark: Numpy array (... x time), or (... x time x member) for ensembles, with the benchmark forecast.
+    :param ensemble: boolean, True if the benchmark has a member axis.
+    :param dtype: Numpy floating point type of the family members (default float64).
+    :return: Numpy array (n x ... x time), or (n x ... x time x member) for ensembles.
+    """
+
+    dtype = np.dtype(float if dtype is None else dtype)
+    k = np.asarray(k).astype(dtype, copy=False)
+    k = k.reshape(k.shape + (1,) * (benchmark.ndim + 1 - k.ndim))
+    observations = observations[..., np.newaxis] if ensemble else observations
+
+    return (1 - k) * observations.astype(dtype, copy=False) + k * benchmark.astype(dtype, copy=False)
+
+
+def achieved_skill(k, skill_name, observations, benchmark):
+
+    """
+    This function computes the skill of the family members obtained with multipliers k.
+
+    :param k: Numpy array (n x ...) of multipliers, with one value per skill level and per forecast.
+    :param skill_name: string, the name of a registered metric.
+    :param observations: Numpy array (... x time) with the observations.
+    :param benchmark: Numpy array (... x time), or (... x time x member) for ensembles, with the benchmark forecast.
+    :return: Numpy array (n x ...) with the skill of each family member.
+    """
+
+    metric = get_metric(skill_name)
+    benchmark_score = metric['score'](benchmark, observations)
+    score = metric['score'](blend(np.asarray(k, dtype=float), observations, benchmark, metric['ensemble']),
+                            observations)
+
+    return (score - benchmark_score) / (metric['perfect'] - benchmark_score)
+
+
+def _array_key(array):
+    return array.shape, array.dtype.str, hashlib.sha1(np.ascontiguousarray(array).tobytes()).hexdigest()
+
+
+def solve_multiplier(skill_values, skill_name, observations, benchmark, tolerance=1e-12, max_iterations=200):
+
+    """
+    This function finds the multipliers k giving the target skill values, for any registered metric. All skill values
+    and forecasts are solved together by bisection. Results are memoised: skill values already solved for the same
+    metric, observations and benchmark are not computed again.
+
+    :param skill_values: vector of floats with the values of the skill that family members should have (at most 1).
+    :param skill_name: string, the name of a registered metric.
+    :param observations: Numpy array (... x time) with the observations, for one or several forecasts (e.g. init dates).
+    :param benchmark: Numpy array (... x time), or (... x time x member) for ensembles, with the benchmark forecast.
+    :param tolerance: float, precision on k.
+    :param max_iterations: int, maximum number of bisection steps.
+    :return: Numpy array (skill x ...) with the multiplier k for each skill value and each forecast.
+    """
+
+    metric = get_metric(skill_name)
+    skill = np.asarray(skill_values, dtype=float).reshape(-1)
+    if np.any(skill > 1):
+        raise ValueError("skill values cannot exceed 1")
+    observations = np.asarray(observations, dtype=float)
+    benchmark = np.asarray(benchmark, dtype=float)
+    forecast_shape = observations.shape[:-1]
+
+    # Skill values already solved for this metric, observations and benchmark
+    key = (skill_name, _array_key(observations), _array_key(benchmark))
+    solved = _cache.setdefault(key, {})
+    missing = np.array(sorted(set(skill.tolist()) - set(solved)))
+
+    if len(missing) > 0:
+        target = missing.reshape((-1,) + (1,) * len(forecast_shape))
+        lower = np.zeros((len(missing),) + forecast_shape)
+        upper = np.ones((len(missing),) + forecast_shape)
+
+        # Invalid values (e.g. log of negative values far beyond the benchmark) count as skill below target
+        with np.errstate(invalid='ignore', divide='ignore'):
+
+            # Skill below zero: extend the bracket beyond the benchmark
+            for i in range(64):
+                beyond = achieved_skill(upper, skill_name, observations, benchmark) > target
+                if not np.any(beyond):
+                    break
+                lower = np.where(beyond, upper, lower)
+                upper = np.where(beyond, 2 * upper, upper)
+
+            # Bisection on all skill values and forecasts at once
+            for i in range(max_iterations):
+                middle = (lower + upper) / 2
+                too_skilful = achieved_skill(middle, skill_name, observations, benchmark) > target
+                lower = np.where(too_skilful, middle, lower)
+                upper = np.where(too_skilful, upper, middle)
+                if np.max(upper - lower) < tolerance:
+                    break
+        k = (lower + upper) / 2
+
+        # Exact values at both ends of the bisection interval
+        k[missing == 1] = 0
+        k[missing == 0] = 1
+
+        for i in range(len(missing)):
+            solved[missing[i]] = k[i]
+
+    return np.stack([solved[s] for s in skill.tolist()])
+
+
+def compute_multiplier(skill_values, skill_name, observations=None, benchmark=None):
+
+    """
+    This function converts skill values into multipliers k, in closed form when there is one and numerically otherwise
+    (in which case observations and benchmark are needed).
+
+    :param skill_values: vector of floats with the values of the skill that family members should have.
+    :param skill_name: string, the name of a registered metric.
+    :param observations: Numpy array (... x time) with the observations.
+    :param benchmark: Numpy array with the benchmark forecast.
+    :return: Numpy array (skill x ...) with the multiplier k for each skill value (and each forecast if solved
+             numerically for several forecasts).
+    """
+
+    if get_metric(skill_name)['multiplier'] is not None:
+        return skill_to_multiplier(skill_values, skill_name)
+    if observations is None or benchmark is None:
+        raise ValueError("observations and benchmark are needed to compute multipliers for " + skill_name)
+
+    return solve_multiplier(skill_values, skill_name, observations, benchmark)
@@ -0,0 +1,43 @@
+"""
+Process-pool parallelism over forecast init dates. Data shared by all init dates (e.g. the historical record) is sent
+once to each worker process when the pool starts, rather than with every task.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+# Task function and shared data of the current worker process
+_worker_state = {}
+
+
+def _init_worker(function, shared):
+    _worker_state['function'] = function
+    _worker_state['shared'] = shared
+
+
+def _run_task(t):
+    return _worker_state['function'](t, **_worker_state['shared'])
+
+
+def map_dates(function, date_list, shared, n_workers=1):
+
+    """
+    Applies `function(t, **shared)` to every date t in `date_list`, either serially or on a pool of processes.
+
+    :param function: module-level function (so that it can be sent to worker processes) taking a date as first argument.
+    :param date_list: list of dates (typically forecast init dates).
+    :param shared: dictionary of keyword arguments common to all dates, sent once to each worker process.
+    :param n_workers: number of worker processes. Default (1) runs serially in the current process.
+    :return: generator of (date, result of `function`) pairs, in the order of `date_list`.
+    """
+
+    # Serial path
+    if n_workers is None or n_workers <= 1 or len(date_list) <= 1:
+        for t in date_list:
+            yield t, function(t, **shared)
+        return
+
+    # Parallel path
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(date_list)), initializer=_init_worker,
+                             initargs=(function, shared)) as executor:
+        for t, result in zip(date_list, executor.map(_run_task, date_list)):
+            yield t, result
@@ -0,0 +1,140 @@
+"""
+Thread-based pipelining of family runs: forecasts are read ahead on a background thread, families are computed on the
+calling thread, and outputs are written on another background thread. Stages are connected by bounded queues, so
+that disk latency overlaps with computation while memory use stays bounded. Reading and writing are mostly I/O (and
+C code releasing the GIL), which threads can overlap with computation.
+
+Errors are propagated to the calling thread: a failed read is raised where its result would have been consumed, and
+a failed write is raised at the next submission, or when the writer is closed.
+"""
+
+import queue
+import threading
+
+# End of a queue
+_DONE = object()
+
+
+def _put(q, item, stop):
+    # Puts an item on a bounded queue, unless the consumer stopped
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(function, items, queue_size=2):
+
+    """
+    This function computes `function(item)` for each item on a background thread, ahead of consumption.
+
+    :param function: function of one item, e.g. reading the forecast of an init date.
+    :param items: iterable of items, e.g. init dates.
+    :param queue_size: int, maximum number of results computed ahead.
+    :return: generator of (item, function(item)) pairs, in the order of items.
+    """
+
+    results = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                if not _put(results, (item, function(item), None), stop):
+                    return
+        except BaseException as error:
+            _put(results, (None, None, error), stop)
+            return
+        _put(results, _DONE, stop)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            entry = results.get()
+            if entry is _DONE:
+                return
+            item, result, error = entry
+            if error is not None:
+                raise error
+            yield item, result
+    finally:
+        stop.set()
+        thread.join()
+
+
+class BackgroundWriter:
+
+    """
+    Runs write tasks on a background thread, in the order they are submitted, through a bounded queue:
+
+        with BackgroundWriter() as background:
+            for ...:
+                background.submit(write_family, family, ...)
+
+    Once a task fails, the following tasks are skipped, and the error is raised in the calling thread by the next call
+    to `submit` or by `close` (called on leaving the `with` block).
+    """
+
+    def __init__(self, queue_size=4):
+
+        """
+        :param queue_size: int, maximum number of tasks waiting to be run. Submitting blocks while the queue is full.
+        """
+
+        self._tasks = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._tasks.get()
+            if task is _DONE:
+                return
+            if self._error is None:
+                function, args = task
+                try:
+                    function(*args)
+                except BaseException as error:
+                    self._error = error
+
+    def _raise(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, function, *args):
+
+        """Queues `function(*args)` to be run on the background thread; raises the error of a failed task, if any."""
+
+        self._raise()
+        self._tasks.put((function, args))
+
+        return None
+
+    def close(self):
+
+        """Waits for all queued tasks to be run, stops the thread, and raises the error of a failed task, if any."""
+
+        if self._thread.is_alive():
+            self._tasks.put(_DONE)
+            self._thread.join()
+        self._raise()
+
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Do not hide the error of the calling thread
+            try:
+                self.close()
+            except BaseException:
+                pass
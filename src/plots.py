@@ -0,0 +1,127 @@
+"""
+Batch rendering of ensemble forecast families, for all skill values and init dates of a hindcast. For each forecast,
+a single figure is drawn: the benchmark bands and the observations are drawn once, and only the lines of the family
+members are updated from one skill value to the next. Figures are rendered off-screen (Agg canvas, no pyplot), so
+that nothing accumulates in memory and rendering can be spread over worker processes.
+"""
+
+import pandas as pd
+import numpy as np
+import os
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from src.forecasts import forecast_name, read_forecast
+from src.history import observation_index
+from src.parallel import map_dates
+from src.storage import FamilyStore
+
+# First letters of month names, for date axis labels
+MONTH_LABELS = ['J', 'F', 'M', 'A', 'M', 'J', 'J', 'A', 'S', 'O', 'N', 'D']
+
+
+def render_family(observations, benchmark, family, skill_values, destination, ylabel='Cumulative rainfall (mm)'):
+
+    """
+    This function plots an ensemble forecast family against observations and the benchmark ensemble, one PNG file per
+    skill value, as `ensemble.plot_family` does, but from a family in memory and reusing a single figure.
+
+    :param observations: Pandas Series (or Numpy array) with the observations over the forecast period.
+    :param benchmark: Pandas DataFrame (time x member) with the benchmark ensemble, indexed by forecast date.
+    :param family: Numpy array (skill x time x member) with the family, e.g. from `ensemble.compute_family` or
+           `storage.FamilyStore.family`.
+    :param skill_values: vector of floats with the skill of each family member.
+    :param destination: string, destination folder of the figures.
+    :param ylabel: string, label of the y-axis.
+    :return: list of the paths to the PNG files.
+    """
+
+    dates = benchmark.index
+    hist_data = np.asarray(observations, dtype=float)
+    bench = np.asarray(benchmark, dtype=float)
+    bench_min, bench_mean, bench_max = bench.min(axis=1), bench.mean(axis=1), bench.max(axis=1)
+    os.makedirs(destination, exist_ok=True)
+
+    # Initialise figure, off-screen
+    fig = Figure(figsize=(6.7, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+
+    # Static artists: benchmark bands and observations
+    hb, = ax.plot(dates, bench_mean, alpha=.2, color='black', label='Benchmark')
+    ax.fill_between(dates, bench_mean, bench_max, alpha=.2, color='black')
+    ax.fill_between(dates, bench_min, bench_mean, alpha=.2, color='black')
+    member_lines = ax.plot(dates, family[0], c='red', linewidth=0.5)
+    member_lines[0].set_label('Forecast')
+    h, = ax.plot(dates, hist_data, c='blue', label='Observations', linewidth=2)
+    legend = ax.legend(handles=[h, hb, member_lines[0]], loc=2, prop={'size': 16})
+
+    # Axes
+    date_list = pd.date_range(start=dates[0], periods=8, freq='MS')
+    ax.set_xlabel('Date', size=14)
+    ax.xaxis.set_ticks(date_list)
+    ax.xaxis.set_ticklabels([MONTH_LABELS[(d.month - 1) % 12] for d in date_list])
+    ax.tick_params(labelsize=14)
+    ax.set_xlim(dates[0], dates[-1])
+    ax.set_ylabel(ylabel, size=14)
+    title = ax.set_title('', size=18)
+    static_low = np.nanmin([bench_min.min(), np.nanmin(hist_data)])
+    static_high = np.nanmax([bench_max.max(), np.nanmax(hist_data)])
+
+    # Only family member lines, y-limits, legend visibility and title change from one skill value to the next
+    paths = []
+    for i in range(len(skill_values)):
+        for j in range(len(member_lines)):
+            member_lines[j].set_ydata(family[i, :, j])
+        low = min(static_low, np.nanmin(family[i]))
+        high = max(static_high, np.nanmax(family[i]))
+        margin = 0.05 * (high - low) if high > low else 0.5
+        ax.set_ylim(low - margin, high + margin)
+        legend.set_visible(i == 0)
+        title.set_text('(' + chr(ord('`') + i + 1) + ') CRPSS=' + str(skill_values[i]))
+        paths.append(destination + '/family_CRPSS=' + str(skill_values[i]) + '.png')
+        fig.savefig(paths[-1])
+
+    return paths
+
+
+def plot_hindcast(history_file, forecast_folder, variable_names, store_path, destination, skill_values=None,
+                  n_workers=1, ylabel='Cumulative rainfall (mm)'):
+
+    """
+    This function plots the ensemble forecast families of every init date of a family store, in one folder per init
+    date, possibly spreading init dates over worker processes.
+
+    :param history_file: string, full path to file with historical data.
+    :param forecast_folder: string, the path to the folder where the benchmark forecasts are, or a
+           `forecasts.ForecastCube`.
+    :param variable_names: string duplet with the name of the variable both in historical data and forecasts.
+    :param store_path: string, folder of a family store written by `storage.FamilyWriter`.
+    :param destination: string, destination folder; figures of each init date go to a sub-folder named after the
+           forecast.
+    :param skill_values: vector of floats with the skill values to plot (default: all skill values in the store).
+    :param n_workers: number of processes over which init dates are spread (default 1: serial run).
+    :param ylabel: string, label of the y-axis.
+    :return: dictionary {init date: list of paths to the PNG files}.
+    """
+
+    store = FamilyStore(store_path)
+    if skill_values is None:
+        skill_values = store.skill_values.tolist()
+    shared = {'observations': observation_index(history_file, variable_names[0]), 'forecast_folder': forecast_folder,
+              'variable_names': variable_names, 'store_path': store_path, 'skill_values': skill_values,
+              'destination': destination, 'ylabel': ylabel}
+
+    return dict(map_dates(_plot_date, list(store.init_dates), shared, n_workers))
+
+
+def _plot_date(t, observations, forecast_folder, variable_names, store_path, skill_values, destination, ylabel):
+
+    """Plots the family of init date t (see `plot_hindcast`)."""
+
+    benchmark = read_forecast(forecast_folder, t, variable_names[1])
+    store = FamilyStore(store_path)
+    family = store.sel(t, skill_values)
+
+    return render_family(observations.window(benchmark.index), benchmark, family, skill_values,
+                         destination + '/' + forecast_name(t, variable_names[1]), ylabel)
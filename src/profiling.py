@@ -0,0 +1,141 @@
+"""
+Instrumentation of family runs. A `StageProfiler` records, for each stage of a run (reading forecasts, parsing dates,
+aligning historical data, computing families, writing them...) and each init date: wall-clock time, bytes read and
+written, and peak memory allocated during the stage. Records can be exported to JSON or CSV:
+
+    with StageProfiler() as profiler:
+        ecmwf_ensemble_family(..., profiler=profiler)
+    profiler.to_csv('profile.csv')
+    profiler.summary()                -> totals by stage
+
+Functions that accept a profiler run uninstrumented (no overhead) when it is None.
+"""
+
+import pandas as pd
+import numpy as np
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+class StageProfiler:
+
+    def __init__(self, memory=True):
+
+        """
+        :param memory: boolean, if True record peak memory allocation of each stage (with `tracemalloc`, which slows
+               down allocation-heavy code, e.g. CSV parsing).
+        """
+
+        self.memory = memory
+        self.records = []
+        self._tracing = False
+        if memory is True and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+    @contextmanager
+    def stage(self, name, init_date=None, variable=None, bytes_read=0):
+
+        """
+        Context manager recording one stage. It yields the record (a dictionary), in which the instrumented code can
+        set 'bytes_read' and 'bytes_written'.
+
+        :param name: string, the name of the stage (e.g. 'read_csv').
+        :param init_date: init date the stage works on (None for stages common to all init dates).
+        :param variable: string, the variable the stage works on.
+        :param bytes_read: int, bytes read by the stage, if known beforehand.
+        """
+
+        record = {'init_date': None if init_date is None else pd.Timestamp(init_date).strftime('%Y-%m-%d'),
+                  'variable': variable, 'stage': name, 'seconds': 0.0, 'peak_bytes': None,
+                  'bytes_read': int(bytes_read), 'bytes_written': 0}
+        if self.memory is True:
+            start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if self.memory is True:
+                record['peak_bytes'] = max(tracemalloc.get_traced_memory()[1] - start_memory, 0)
+            self.records.append(record)
+
+    def extend(self, records):
+        """Adds records made elsewhere, e.g. by a profiler in a worker process."""
+        self.records.extend(records)
+
+    def close(self):
+        """Stops memory tracing, if this profiler started it."""
+        if self._tracing is True:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def to_frame(self):
+        """Records as a Pandas DataFrame, one row per stage and init date."""
+        return pd.DataFrame(self.records, columns=['init_date', 'variable', 'stage', 'seconds', 'peak_bytes',
+                                                   'bytes_read', 'bytes_written'])
+
+    def summary(self):
+
+        """Pandas DataFrame with, by stage: number of calls, total time, bytes read and written, and largest peak."""
+
+        frame = self.to_frame()
+        summary = frame.groupby('stage', sort=False).agg(calls=('seconds', 'size'), seconds=('seconds', 'sum'),
+                                                         bytes_read=('bytes_read', 'sum'),
+                                                         bytes_written=('bytes_written', 'sum'),
+                                                         peak_bytes=('peak_bytes', 'max'))
+
+        return summary.sort_values('seconds', ascending=False)
+
+    def to_json(self, path):
+        """Writes records to a JSON file (list of records)."""
+        with open(path, 'w') as f:
+            json.dump(self.records, f, indent=1, default=lambda x: x.item() if isinstance(x, np.generic) else str(x))
+
+    def to_csv(self, path):
+        """Writes records to a CSV file."""
+        self.to_frame().to_csv(path_or_buf=path, index=False)
+
+
+def profile_stage(profiler, name, init_date=None, variable=None, bytes_read=0):
+
+    """Context manager recording a stage with `profiler`, or doing nothing (but yielding a record) if it is None."""
+
+    if profiler is None:
+        return nullcontext({'bytes_read': 0, 'bytes_written': 0})
+
+    return profiler.stage(name, init_date, variable, bytes_read)
+
+
+def worker_profiler(profile):
+
+    """Profiler of a task run by `parallel.map_dates`, from the options of the calling profiler (None: no profiler)."""
+
+    return None if profile is None else StageProfiler(**profile)
+
+
+def profiler_options(profiler):
+
+    """Options to create profilers in worker processes (see `worker_profiler`); None if `profiler` is None."""
+
+    return None if profiler is None else {'memory': profiler.memory}
+
+
+def worker_records(profiler):
+
+    """Records of a worker profiler (None if there is none), after stopping it."""
+
+    if profiler is None:
+        return None
+    profiler.close()
+
+    return profiler.records
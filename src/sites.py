@@ -0,0 +1,99 @@
+"""
+Forecast families for many sites (catchments, grid cells...) at once. Observations and forecasts of all sites are
+stacked along a site axis, and the families of every site and skill value are computed in one vectorised operation.
+Site metadata (e.g. name, coordinates, area) is kept alongside the families.
+"""
+
+import pandas as pd
+import numpy as np
+
+from src import deterministic, ensemble
+from src.multiplier import get_metric
+
+
+class SiteFamilies:
+
+    """
+    Forecast families of several sites, sharing forecast dates and skill values.
+
+    Attributes:
+        values       = Numpy array (skill x site x time x member) for ensembles, (skill x site x time) otherwise
+        skill_values = 1-D Numpy array with the skill values
+        sites        = Pandas DataFrame with the site metadata, indexed by site
+        lead_dates   = DatetimeIndex with the forecast dates
+        members      = names of the ensemble members (None for deterministic families)
+    """
+
+    def __init__(self, values, skill_values, sites, lead_dates, members=None):
+        self.values = values
+        self.skill_values = np.asarray(skill_values, dtype=float)
+        self.sites = sites
+        self.lead_dates = lead_dates
+        self.members = members
+
+    def _skill_position(self, skill):
+        matches = np.flatnonzero(np.isclose(self.skill_values, skill))
+        if len(matches) == 0:
+            raise KeyError("skill value not in families: " + str(skill))
+        return matches[0]
+
+    def member(self, skill, site):
+
+        """
+        Family member with skill `skill` at site `site`.
+
+        :return: Pandas DataFrame (time x member) for ensembles, Pandas Series otherwise.
+        """
+
+        values = self.values[self._skill_position(skill), self.sites.index.get_loc(site)]
+        if self.members is None:
+            return pd.Series(data=values, index=self.lead_dates, name=site)
+
+        return pd.DataFrame(data=values, index=self.lead_dates, columns=self.members)
+
+    def site(self, site):
+
+        """Families of one site, as an array (skill x time x member) or (skill x time), with the site metadata."""
+
+        return self.values[:, self.sites.index.get_loc(site)], self.sites.loc[site]
+
+
+def site_families(observations, forecasts, skill_values, skill_name='CRPSS', sites=None, dtype=None):
+
+    """
+    This function computes the forecast families of many sites in one vectorised operation.
+
+    :param observations: Pandas DataFrame (time x site) with the observations at each site.
+    :param forecasts: for ensemble families, dictionary {site: Pandas DataFrame (time x member)} with the benchmark
+           ensemble at each site (all with the same dates and members); for deterministic families, Pandas DataFrame
+           (time x site) with the benchmark forecast at each site.
+    :param skill_values: vector of floats with the values of the skill that family members should have.
+    :param skill_name: string, the metric upon which skill is based. Ensemble metrics (default 'CRPSS') need ensemble
+           forecasts, deterministic metrics (e.g. 'MAE', 'MSE') need deterministic forecasts.
+    :param sites: Pandas DataFrame with site metadata, indexed by site (default: no metadata, sites of observations).
+    :param dtype: Numpy floating point type of the families (default float64), see `ensemble.compute_family`.
+    :return: SiteFamilies
+    """
+
+    if sites is None:
+        sites = pd.DataFrame(index=observations.columns)
+    site_list = list(sites.index)
+    obs = observations.loc[:, site_list].to_numpy(dtype=float).T
+
+    # Ensemble families: sites x time x member
+    if get_metric(skill_name)['ensemble'] is True:
+        members = forecasts[site_list[0]].columns
+        for site in site_list:
+            if not forecasts[site].index.equals(observations.index) or not forecasts[site].columns.equals(members):
+                raise ValueError("forecasts at all sites must share the dates of observations and their members")
+        fore = np.stack([forecasts[site].to_numpy(dtype=float) for site in site_list])
+        values = ensemble.compute_family(obs, fore, skill_values, skill_name, dtype)
+        return SiteFamilies(values, skill_values, sites, observations.index, members)
+
+    # Deterministic families: sites x time
+    if not forecasts.index.equals(observations.index):
+        raise ValueError("forecasts must share the dates of observations")
+    fore = forecasts.loc[:, site_list].to_numpy(dtype=float).T
+    values = deterministic.compute_family(obs, fore, skill_values, skill_name, dtype)
+
+    return SiteFamilies(values, skill_values, sites, observations.index)
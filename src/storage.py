@@ -0,0 +1,238 @@
+"""
+Binary storage for forecast families. A whole family run (all init dates, lead dates, skill values and members) is
+stored in a single folder containing:
+    values.bin  = raw family values, one contiguous chunk (skill x lead x member) per init date
+    index.npz   = init dates, lead dates, skill values, member names and the position of each chunk in values.bin
+Values are read back through a memory map, so that slicing a family does not copy nor parse anything.
+"""
+
+import pandas as pd
+import numpy as np
+import os
+
+VALUES_FILE = 'values.bin'
+INDEX_FILE = 'index.npz'
+
+
+class FamilyWriter:
+
+    """
+    Writes a family run to a binary family store, one init date at a time. Use as a context manager, or call `close`
+    once all init dates have been written (the index is only saved at that point):
+
+        with FamilyWriter('ECMWF_families/Rain_CRPSS') as writer:
+            ecmwf_ensemble_family(..., writer=writer)
+    """
+
+    def __init__(self, path, dtype=None):
+
+        """
+        :param path: string, folder of the family store. It is created if needed; an existing store is overwritten,
+               and cannot be read until the writer is closed.
+        :param dtype: Numpy data type in which values are stored (e.g. np.float32), families being converted to it.
+               Default (None) stores values in the data type of the families written.
+        """
+
+        self.path = path
+        if os.path.exists(path) is False:
+            os.makedirs(path)
+
+        # The index of an existing store would not describe the values written from now on
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            os.remove(os.path.join(path, INDEX_FILE))
+        self._values = open(os.path.join(path, VALUES_FILE), 'wb')
+        self._offset = 0
+        self._dtype = None if dtype is None else np.dtype(dtype)
+        self._skill_values = None
+        self._members = None
+        self._init_dates = []
+        self._chunk_offsets = []
+        self._lead_counts = []
+        self._lead_dates = []
+
+    def write(self, init_date, family, lead_dates, members, skill_values):
+
+        """
+        Appends the family generated for one init date to the store.
+
+        :param init_date: date at which the benchmark forecast was issued.
+        :param family: 3-D Numpy array (skill x lead x member) with the forecast family.
+        :param lead_dates: dates of the forecast (length equal to family.shape[1]).
+        :param members: names of the ensemble members (length equal to family.shape[2]).
+        :param skill_values: vector of floats with the values of the skill of family members (length family.shape[0]).
+        :return: None
+        """
+
+        family = np.ascontiguousarray(family, dtype=self._dtype)
+        if family.ndim != 3 or family.shape != (len(skill_values), len(lead_dates), len(members)):
+            raise ValueError("family must be a 3-D array (skill x lead x member) consistent with its labels")
+
+        # The first init date sets skill values, members and data type for the whole store
+        if self._skill_values is None:
+            self._dtype = family.dtype
+            self._skill_values = np.asarray(skill_values, dtype=float)
+            self._members = np.array([str(m) for m in members])
+        elif family.dtype != self._dtype or \
+                not np.array_equal(np.asarray(skill_values, dtype=float), self._skill_values) or \
+                not np.array_equal(np.array([str(m) for m in members]), self._members):
+            raise ValueError("all init dates in a family store must share skill values, members and data type")
+
+        self._values.write(family.tobytes())
+        self._init_dates.append(pd.Timestamp(init_date))
+        self._chunk_offsets.append(self._offset)
+        self._lead_counts.append(family.shape[1])
+        self._lead_dates.append(pd.DatetimeIndex(lead_dates).values.astype('datetime64[ns]'))
+        self._offset += family.size
+
+        return None
+
+    def close(self):
+
+        """Flushes values to disk and saves the index of the store."""
+
+        if self._values.closed:
+            return None
+        self._values.close()
+        np.savez(os.path.join(self.path, INDEX_FILE),
+                 init_dates=pd.DatetimeIndex(self._init_dates).values.astype('datetime64[ns]'),
+                 chunk_offsets=np.array(self._chunk_offsets, dtype=np.int64),
+                 lead_counts=np.array(self._lead_counts, dtype=np.int64),
+                 lead_dates=np.concatenate(self._lead_dates) if self._lead_dates else
+                 np.array([], dtype='datetime64[ns]'),
+                 skill_values=self._skill_values if self._skill_values is not None else np.array([]),
+                 members=self._members if self._members is not None else np.array([], dtype=str),
+                 dtype=np.array(str(np.dtype(self._dtype if self._dtype is not None else float))))
+
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FamilyStore:
+
+    """
+    Reads a family store written by `FamilyWriter`. Families are returned as views of a memory map (no copy):
+
+        store = FamilyStore('ECMWF_families/Rain_CRPSS')
+        store.family('2011/11/01')               -> Numpy array (skill x lead x member)
+        store.member('2011/11/01', 0.4)          -> Pandas DataFrame (lead x member) for skill 0.4
+        store.sel('2011/11/01', [0.2, 0.4], ['0', '1'], '2011/12/01', '2011/12/31')
+
+    Lead date ranges, and skill values or members at evenly spaced positions in the store (e.g. consecutive ones), are
+    selected with basic slices, which remain views of the memory map; other selections of skill values or members
+    are copied.
+    """
+
+    def __init__(self, path):
+
+        """
+        :param path: string, folder of the family store.
+        """
+
+        self.path = path
+        with np.load(os.path.join(path, INDEX_FILE)) as index:
+            self.init_dates = pd.DatetimeIndex(index['init_dates'])
+            self.skill_values = index['skill_values']
+            self.members = pd.Index(index['members'])
+            self.dtype = np.dtype(str(index['dtype']))
+            self._chunk_offsets = index['chunk_offsets']
+            self._lead_counts = index['lead_counts']
+            self._lead_dates = index['lead_dates']
+        self._lead_offsets = np.concatenate([[0], np.cumsum(self._lead_counts)])
+        if len(self.init_dates) > 0:
+            self._values = np.memmap(os.path.join(path, VALUES_FILE), dtype=self.dtype, mode='r')
+        else:
+            self._values = np.array([], dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.init_dates)
+
+    def _date_position(self, init_date):
+        position = self.init_dates.get_indexer([pd.Timestamp(init_date)])[0]
+        if position < 0:
+            raise KeyError("init date not in family store: " + str(init_date))
+        return position
+
+    def skill_position(self, skill_values):
+
+        """Positions of the given skill values in the store (up to floating point precision)."""
+
+        skill = np.atleast_1d(np.asarray(skill_values, dtype=float))
+        matches = np.isclose(skill[:, np.newaxis], self.skill_values[np.newaxis, :])
+        if not np.all(matches.any(axis=1)):
+            raise KeyError("skill value(s) not in family store: " + str(skill_values))
+
+        return matches.argmax(axis=1)
+
+    def _lead_slice(self, position, start, end):
+        # Slice of the lead days of the forecast at a position that lie between start and end dates (included)
+        dates = self._lead_dates[self._lead_offsets[position]:self._lead_offsets[position + 1]]
+        first = 0 if start is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(start)), 'left'))
+        last = len(dates) if end is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(end)), 'right'))
+        return slice(first, max(first, last))
+
+    @staticmethod
+    def _basic_index(positions):
+        # Positions as a slice when they are evenly spaced and increasing, so that indexing gives a view
+        if len(positions) == 1:
+            return slice(int(positions[0]), int(positions[0]) + 1)
+        steps = np.diff(positions)
+        if len(positions) > 1 and steps[0] > 0 and np.all(steps == steps[0]):
+            return slice(int(positions[0]), int(positions[-1]) + 1, int(steps[0]))
+        return positions
+
+    def lead_dates(self, init_date):
+
+        """Dates of the forecast issued at `init_date`."""
+
+        position = self._date_position(init_date)
+
+        return pd.DatetimeIndex(self._lead_dates[self._lead_offsets[position]:self._lead_offsets[position + 1]])
+
+    def family(self, init_date):
+
+        """Whole family for `init_date`, as a read-only Numpy array (skill x lead x member) mapped on disk."""
+
+        position = self._date_position(init_date)
+        shape = (len(self.skill_values), self._lead_counts[position], len(self.members))
+        start = self._chunk_offsets[position]
+
+        return self._values[start:start + int(np.prod(shape))].reshape(shape)
+
+    def sel(self, init_date, skill_values=None, members=None, start=None, end=None):
+
+        """
+        Slice of the family for `init_date`, by skill values, member names and / or range of lead dates.
+
+        :param start: first lead date of the slice (default: first lead date of the forecast).
+        :param end: last lead date of the slice (default: last lead date of the forecast).
+        :return: Numpy array (skill x lead x member), a view of the memory map unless skill values or members are
+                 not evenly spaced in the store.
+        """
+
+        values = self.family(init_date)[:, self._lead_slice(self._date_position(init_date), start, end)]
+        if skill_values is not None:
+            values = values[self._basic_index(self.skill_position(skill_values))]
+        if members is not None:
+            positions = self.members.get_indexer(pd.Index(np.atleast_1d(members)).astype(str))
+            if np.any(positions < 0):
+                raise KeyError("unknown ensemble member(s): " + str(members))
+            values = values[:, :, self._basic_index(positions)]
+
+        return values
+
+    def member(self, init_date, skill, start=None, end=None):
+
+        """
+        Family member with skill `skill` for `init_date`, as a Pandas DataFrame (lead x member) viewing the memory map,
+        optionally between `start` and `end` lead dates.
+        """
+
+        leads = self._lead_slice(self._date_position(init_date), start, end)
+
+        return pd.DataFrame(data=self.family(init_date)[self.skill_position(skill)[0], leads],
+                            index=self.lead_dates(init_date)[leads], columns=self.members, copy=False)
@@ -0,0 +1,109 @@
+"""
+Streaming generation of forecast families over long hindcast archives. Forecasts are read one init date at a time,
+and families are yielded in blocks (one per init date, or one per block of lead days), so that memory use does not
+depend on the length of the archive. Blocks can be consumed one after the other, e.g. by a simulation model or by a
+writer:
+
+    with FamilyWriter('ECMWF_families/Rain_CRPSS') as writer:
+        for block in stream_families(history_file, forecast_folder, ['Rain', 'Rain'], skill_values, begin, end):
+            writer.write(block.init_date, block.values, block.lead_dates, block.members, block.skill_values)
+"""
+
+import pandas as pd
+import numpy as np
+from collections import namedtuple
+
+from src import deterministic, ensemble
+from src.forecasts import deterministic_forecast, read_forecast
+from src.history import observation_index
+from src.multiplier import compute_multiplier, get_metric
+
+# A block of a forecast family:
+#     init_date     = date at which the benchmark forecast was issued
+#     lead_dates    = DatetimeIndex with the forecast dates in the block
+#     members       = names of the ensemble members (single member for deterministic families)
+#     skill_values  = skill values of the family members
+#     values        = Numpy array (skill x lead x member)
+FamilyBlock = namedtuple('FamilyBlock', ['init_date', 'lead_dates', 'members', 'skill_values', 'values'])
+
+
+def iter_forecasts(forecast_folder, variable_name, begin_date, end_date):
+
+    """
+    This function reads monthly forecasts one at a time.
+
+    :param forecast_folder: string, the path to the folder where the forecasts are.
+    :param variable_name: string, the name of the variable in the forecasts.
+    :param begin_date: first init date. Format 'YYYY/MM/DD'
+    :param end_date: last init date. Format 'YYYY/MM/DD'
+    :return: generator of (init date, Pandas DataFrame with the forecast ensemble) pairs.
+    """
+
+    for t in pd.date_range(start=begin_date, end=end_date, freq='MS'):
+        yield t, read_forecast(forecast_folder, t, variable_name)
+
+
+def family_blocks(t, observations, benchmark, skill_values, skill_name, lead_block=None, dtype=None):
+
+    """
+    This function computes the family of one forecast, block by block.
+
+    :param t: init date of the forecast.
+    :param observations: Pandas Series with the observations over the forecast period.
+    :param benchmark: Pandas DataFrame (ensemble) or Pandas Series (deterministic) with the benchmark forecast.
+    :param skill_values: vector of floats with the values of the skill that family members should have.
+    :param skill_name: string, the name of the metric upon which skill is based.
+    :param lead_block: int, number of lead days per block. Default (None) yields the whole forecast in one block.
+    :param dtype: Numpy floating point type of the family (default float64), see `ensemble.compute_family`.
+    :return: generator of FamilyBlock.
+    """
+
+    obs = np.asarray(observations, dtype=float)
+    fore = np.asarray(benchmark, dtype=float)
+    deterministic_benchmark = isinstance(benchmark, pd.Series)
+    members = [benchmark.name] if deterministic_benchmark else list(benchmark.columns)
+
+    # Multipliers are computed on the whole forecast, so that skill does not depend on blocks
+    k = compute_multiplier(skill_values, skill_name, obs, fore)
+
+    n_lead = len(obs)
+    if lead_block is None:
+        lead_block = max(n_lead, 1)
+    for start in range(0, n_lead, lead_block):
+        rows = slice(start, start + lead_block)
+        if deterministic_benchmark:
+            values = deterministic.compute_family(obs[rows], fore[rows], skill_values, skill_name, dtype,
+                                                  multipliers=k)[..., np.newaxis]
+        else:
+            values = ensemble.compute_family(obs[rows], fore[rows], skill_values, skill_name, dtype, multipliers=k)
+        yield FamilyBlock(t, benchmark.index[rows], members, skill_values, values)
+
+
+def stream_families(history_file, forecast_folder, variable_names, skill_values, begin_date, end_date,
+                    skill_name='CRPSS', lead_block=None, dtype=None):
+
+    """
+    This function generates families of ensemble or deterministic forecasts over a range of init dates, and yields
+    them block by block. Only one forecast (and one block of its family) is held in memory at a time.
+
+    :param history_file: string, full path to file with historical data for which we have the forecasts.
+    :param forecast_folder: string, the path to the folder where the forecasts are.
+    :param variable_names: string duplet with the name of the variable both in historical data and forecasts.
+    :param skill_values: vector of floats with the values of the skill that family members should have.
+    :param begin_date: first init date. Format 'YYYY/MM/DD'
+    :param end_date: last init date. Format 'YYYY/MM/DD'
+    :param skill_name: string, the metric upon which skill is based. Ensemble metrics (default 'CRPSS') give ensemble
+           families; deterministic metrics (e.g. 'MAE', 'MSE') give families of the ensemble average.
+    :param lead_block: int, number of lead days per block. Default (None) yields one block per init date.
+    :param dtype: Numpy floating point type of the families (default float64), see `ensemble.compute_family`.
+    :return: generator of FamilyBlock, in order of init dates then lead dates.
+    """
+
+    observations = observation_index(history_file, variable_names[0])
+    ensemble = get_metric(skill_name)['ensemble']
+
+    for t, fore_data in iter_forecasts(forecast_folder, variable_names[1], begin_date, end_date):
+        benchmark = fore_data if ensemble else deterministic_forecast(fore_data, variable_names[1])
+        for block in family_blocks(t, observations.window(fore_data.index), benchmark, skill_values, skill_name,
+                                   lead_block, dtype):
+            yield block
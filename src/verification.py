@@ -0,0 +1,97 @@
+"""
+Verification of forecast families: computes the skill that family members actually achieve, to be compared with the
+skill they were generated for. All functions work on whole arrays at once, where the first axis is the skill level and
+the other axes can be, e.g., init dates and lead times:
+    ensemble family      = array (skill x ... x time x member), benchmark = array (... x time x member)
+    deterministic family = array (skill x ... x time),          benchmark = array (... x time)
+    observations         = array (... x time)
+Each forecast is scored with a metric of `multiplier.METRICS`, and scores are averaged over all axes but the skill axis.
+Missing values (NaN) are left out of the averages, so that forecasts of different lengths can be stacked in one array
+padded with NaN.
+"""
+
+import pandas as pd
+import numpy as np
+
+
+def crps(ensemble, observations):
+
+    """
+    This function computes the continuous ranked probability score (CRPS) of ensemble forecasts, using the empirical
+    distribution of ensemble members:
+        CRPS = mean_i |x_i - y| - 1 / (2 m^2) sum_i sum_j |x_i - x_j|
+    The double sum is computed from sorted members in O(m log m) operations, rather than O(m^2):
+        sum_i sum_j |x_i - x_j| = 2 sum_i (2i - m - 1) x_(i)    where x_(1) <= ... <= x_(m)
+
+    :param ensemble: Numpy array (... x member) of ensemble forecasts.
+    :param observations: Numpy array (...) of observations, broadcastable against the ensemble without member axis.
+    :return: Numpy array (...) with the CRPS of each forecast.
+    """
+
+    ensemble = np.asarray(ensemble, dtype=float)
+    observations = np.asarray(observations, dtype=float)
+    m = ensemble.shape[-1]
+
+    # Accuracy term
+    accuracy = np.mean(np.abs(ensemble - observations[..., np.newaxis]), axis=-1)
+
+    # Spread term, from sorted members
+    weights = 2 * np.arange(1, m + 1) - m - 1
+    spread = np.sum(np.sort(ensemble, axis=-1) * weights, axis=-1) / m ** 2
+
+    return accuracy - spread
+
+
+def family_skill(family, observations, benchmark, skill_name='CRPSS'):
+
+    """
+    This function computes the skill of every member of a forecast family, with respect to the benchmark forecast,
+    with the score of a metric registered in `multiplier.METRICS`: each forecast is scored, scores are averaged over
+    forecasts, and skill = (score of family member - score of benchmark) / (perfect score - score of benchmark).
+
+    :param family: Numpy array with the family (skill x ... x time x member for ensembles, e.g. from
+           `ensemble.compute_family`; skill x ... x time for deterministic forecasts, e.g.
+           `deterministic.generate_family(...).values.T`).
+    :param observations: Numpy array (... x time) with the observations.
+    :param benchmark: Numpy array with the benchmark forecast (same shape as family without the skill axis).
+    :param skill_name: string, the name of a registered metric (e.g. 'CRPSS' for ensembles, 'MAE', 'MSE' or 'KGE').
+    :return: 1-D Numpy array with the skill of each family member.
+    """
+
+    # Imported here, as `multiplier` scores ensembles with `crps`
+    from src.multiplier import get_metric
+
+    metric = get_metric(skill_name)
+    family = np.asarray(family, dtype=float)
+    observations = np.asarray(observations, dtype=float)
+    benchmark = np.asarray(benchmark, dtype=float)
+    if family.shape[1:] != benchmark.shape:
+        raise ValueError("family must have the shape of the benchmark forecast, plus a skill axis")
+
+    family_score = metric['score'](family, observations)
+    family_score = np.nanmean(family_score.reshape(len(family), -1), axis=1)
+    benchmark_score = np.nanmean(metric['score'](benchmark, observations))
+
+    return (family_score - benchmark_score) / (metric['perfect'] - benchmark_score)
+
+
+def verify_family(family, observations, benchmark, skill_values, skill_name='CRPSS'):
+
+    """
+    This function compares the skill that forecast family members were generated for (target) with the skill they
+    achieve.
+
+    :param family: Numpy array with the family (skill x ... x time x member for ensembles, skill x ... x time for
+           deterministic forecasts).
+    :param observations: Numpy array (... x time) with the observations.
+    :param benchmark: Numpy array with the benchmark forecast (same shape as family without the skill axis).
+    :param skill_values: vector of floats with the target skill of each family member.
+    :param skill_name: string, the metric upon which skill is based ('CRPSS' for ensembles, 'MAE', 'MSE', or another
+           metric registered in `multiplier.METRICS`).
+    :return: Pandas DataFrame with columns 'target', 'achieved' and 'error' (achieved - target), one row per member.
+    """
+
+    achieved = family_skill(family, observations, benchmark, skill_name)
+    target = np.asarray(skill_values, dtype=float)
+
+    return pd.DataFrame({'target': target, 'achieved': achieved, 'error': achieved - target})
@@ -0,0 +1,137 @@
+import pandas as pd
+import numpy as np
+
+from src import deterministic, ensemble
+from src.multiplier import compute_multiplier, get_metric
+
+
+class FamilyView:
+
+    """
+    Lazy forecast family. Only the observations and the benchmark forecast are stored: every family member is a
+    linear blend (1 - k) * observations + k * benchmark, and it is computed when (and only where) it is requested.
+
+    The benchmark can be an ensemble (Pandas DataFrame, one column per member) or a deterministic forecast
+    (Pandas Series). Examples, with `view = FamilyView(observations, benchmark, 'CRPSS')`:
+        view[0.5]                                   -> family member with skill 0.5
+        view[0.5, '2011/12/01':'2011/12/31']        -> same, for December only
+        view[0.5, :, ['1', '2']]                    -> same, for members '1' and '2' only
+        view[0.5, :, '1':'3']                       -> same, for members '1' to '3' (by label, end included)
+        view.sel([0, 0.5, 1], start, end, members)  -> Numpy array (skill x time x member) for the requested slice
+    """
+
+    def __init__(self, observations, benchmark, skill_name='CRPSS', dtype=None):
+
+        """
+        :param observations: Pandas Series with the observations, aligned with the benchmark forecast.
+        :param benchmark: Pandas DataFrame (ensemble) or Pandas Series (deterministic) with the benchmark forecast.
+        :param skill_name: string, the metric upon which skill is based ('CRPSS', 'MAE', 'MSE', or another metric
+               registered in `multiplier.METRICS`). Ensemble metrics need an ensemble benchmark, deterministic metrics
+               a deterministic one.
+        :param dtype: Numpy floating point type of the computed members (default float64), see
+               `ensemble.compute_family`.
+        """
+
+        if len(observations) != len(benchmark):
+            raise ValueError("observations and benchmark forecast must have the same length")
+        self.deterministic = isinstance(benchmark, pd.Series)
+        if get_metric(skill_name)['ensemble'] is self.deterministic:
+            raise ValueError(skill_name + " is a skill metric for " +
+                             ("ensemble" if self.deterministic else "deterministic") + " forecasts")
+
+        self.skill_name = skill_name
+        self.dtype = np.dtype(float if dtype is None else dtype)
+        self.index = benchmark.index
+        self.columns = pd.Index([benchmark.name]) if self.deterministic else benchmark.columns
+        self._obs = np.asarray(observations, dtype=float)
+        self._fore = np.asarray(benchmark, dtype=float).reshape(len(self.index), -1)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def shape(self):
+        """Shape (time x member) of one family member."""
+        return self._fore.shape
+
+    def multiplier(self, skill_values):
+        """Multipliers k for the given skill values."""
+        benchmark = self._fore[:, 0] if self.deterministic else self._fore
+        return compute_multiplier(skill_values, self.skill_name, self._obs, benchmark)
+
+    def _rows(self, start, end):
+        # Integer positions of the requested date range
+        return self.index.slice_indexer(start, end)
+
+    def _cols(self, members):
+        # Integer positions of the requested members
+        if members is None:
+            return slice(None)
+        positions = self.columns.get_indexer(pd.Index(np.atleast_1d(members)))
+        if np.any(positions < 0):
+            raise KeyError("unknown ensemble member(s): " + str(members))
+        return positions
+
+    def sel(self, skill_values, start=None, end=None, members=None):
+
+        """
+        Computes the requested slice of the family, and only that slice.
+
+        :param skill_values: float or vector of floats with the skill values of the family members to compute.
+        :param start: first date of the slice (default: first forecast date).
+        :param end: last date of the slice, included (default: last forecast date).
+        :param members: names of the ensemble members to compute (default: all members).
+        :return: Numpy array (skill x time x member).
+        """
+
+        rows = self._rows(start, end)
+        cols = self._cols(members)
+        k = self.multiplier(skill_values)
+        if self.deterministic:
+            return deterministic.compute_family(self._obs[rows], self._fore[rows, 0], skill_values, self.skill_name,
+                                                self.dtype, multipliers=k)[..., np.newaxis]
+
+        return ensemble.compute_family(self._obs[rows], self._fore[rows][:, cols], skill_values, self.skill_name,
+                                       self.dtype, multipliers=k)
+
+    def member(self, skill, start=None, end=None, members=None):
+
+        """
+        Computes one family member, possibly restricted to a date range and / or a subset of ensemble members.
+
+        :param skill: float, skill value of the family member.
+        :param start: first date (default: first forecast date).
+        :param end: last date, included (default: last forecast date).
+        :param members: names of the ensemble members to compute (default: all members).
+        :return: Pandas DataFrame (ensemble benchmark) or Pandas Series (deterministic benchmark).
+        """
+
+        rows = self._rows(start, end)
+        values = self.sel(skill, start, end, members)[0]
+        if self.deterministic:
+            return pd.Series(data=values[:, 0], index=self.index[rows], name='S=' + str(skill))
+        columns = self.columns if members is None else self.columns[self._cols(members)]
+
+        return pd.DataFrame(data=values, index=self.index[rows], columns=columns)
+
+    def __getitem__(self, key):
+
+        # Split key into skill, date range and members
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 3:
+            raise IndexError("a family view is indexed by skill, date range and member")
+        skill = key[0]
+        dates = key[1] if len(key) > 1 else slice(None)
+        members = key[2] if len(key) > 2 else None
+        if isinstance(members, slice):
+            # By label, as dates
+            members = None if members == slice(None) else \
+                self.columns[self.columns.slice_indexer(members.start, members.stop, members.step)]
+        if not isinstance(dates, slice):
+            dates = slice(dates, dates)
+
+        if np.ndim(skill) > 0:
+            return self.sel(skill, dates.start, dates.stop, members)
+
+        return self.member(skill, dates.start, dates.stop, members)
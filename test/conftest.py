@@ -0,0 +1,45 @@
+import pandas as pd
+import numpy as np
+import os
+
+import pytest
+
+
+@pytest.fixture
+def ecmwf_data(tmp_path):
+
+    """
+    Writes a small ECMWF-like data set to a temporary folder: a historical climate file and ensemble forecasts for
+    'Temp' and 'Rain' issued on the first day of three consecutive months, each with 40 lead days and 5 members.
+    Returns a dictionary with the paths and the dates of that data set.
+    """
+
+    rng = np.random.default_rng(42)
+    datafile = str(tmp_path / 'clim_data.csv')
+    forecast_dir = str(tmp_path / 'original_forecasts')
+    family_dir = str(tmp_path / 'families')
+    os.mkdir(forecast_dir)
+    os.mkdir(family_dir)
+
+    # Historical data
+    hist_dates = pd.date_range('1968/12/1', '1969/6/30', freq='D')
+    hist_data = pd.DataFrame({'Temp': rng.normal(5, 3, len(hist_dates)),
+                              'Rain': rng.gamma(0.5, 4, len(hist_dates))},
+                             index=hist_dates.strftime('%d/%m/%Y').rename('Date'))
+    hist_data.to_csv(path_or_buf=datafile)
+
+    # Forecasts
+    init_dates = pd.date_range('1969/1/1', '1969/3/1', freq='MS')
+    for t in init_dates:
+        lead_dates = pd.date_range(t, periods=40, freq='D')
+        for var in ['Temp', 'Rain']:
+            if var == 'Temp':
+                values = rng.normal(5, 3, (40, 5))
+            else:
+                values = np.cumsum(rng.gamma(0.5, 4, (40, 5)), axis=0)
+            forecast = pd.DataFrame(values, index=lead_dates.strftime('%d/%m/%Y').rename('Date'),
+                                    columns=[str(j + 1) for j in range(5)])
+            forecast.to_csv(path_or_buf=forecast_dir + '/' + t.strftime('%Y%m%d') + '_1d_7m_ECMWF_' + var + '.csv')
+
+    return {'history_file': datafile, 'forecast_folder': forecast_dir, 'family_folder': family_dir,
+            'begin_date': '1969/1/1', 'end_date': '1969/3/1', 'init_dates': init_dates}
@@ -0,0 +1,52 @@
+import numpy as np
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from benchmarks.run_benchmarks import compare, load_baseline, run_suite, save_baseline
+from benchmarks.synthetic import write_hindcast
+from src.forecasts import read_forecast
+from src.history import read_history
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_benchmarks.py`
+"""
+
+
+def test_synthetic_hindcast(tmp_path):
+
+    data = write_hindcast(str(tmp_path), n_members=7, n_lead=30, begin_date='1990/11/01', n_init=4,
+                          variables=('Rain', 'Temp', 'Evap'))
+    assert data['variable_names'] == [['Rain', 'Rain'], ['Temp', 'Temp'], ['PET', 'Evap']]
+
+    # Forecasts of every init date, within the period of historical data
+    history = read_history(data['history_file'])
+    for t in data['init_dates']:
+        for names in data['variable_names']:
+            forecast = read_forecast(data['forecast_folder'], t, names[1])
+            assert forecast.shape == (30, 7)
+            assert forecast.index[0] == t and forecast.index[-1] <= history.index[-1]
+            assert not forecast.isnull().values.any()
+        assert np.all(np.diff(read_forecast(data['forecast_folder'], t, 'Rain').values, axis=0) >= 0)
+
+    return None
+
+
+def test_benchmark_suite(tmp_path):
+
+    sizes = {'n_members': 3, 'n_lead': 20, 'n_init': 2, 'n_skill': 2}
+    results = run_suite(sizes, str(tmp_path / 'work'))
+    assert set(results) == {'read_history', 'read_forecasts', 'compute_families', 'write_csv', 'write_store',
+                            'ensemble_driver', 'deterministic_driver'}
+    assert all(results[stage]['seconds'] >= 0 and results[stage]['peak_mb'] >= 0 for stage in results)
+
+    # Baselines are stored by scale, and compared stage by stage
+    baseline_file = str(tmp_path / 'baseline.json')
+    assert load_baseline('tiny', baseline_file) is None
+    save_baseline('tiny', results, baseline_file)
+    table = compare(results, load_baseline('tiny', baseline_file))
+    assert list(table.index) == list(results)
+    np.testing.assert_array_almost_equal(table['time_ratio'].values, 1)
+
+    return None
@@ -0,0 +1,63 @@
+import pandas as pd
+import numpy as np
+import pickle
+
+import pytest
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.ensemble import ecmwf_ensemble_family
+from src.forecasts import ingest_forecasts, read_forecast, ForecastCube
+from src.storage import FamilyWriter, FamilyStore
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_cube.py`
+"""
+
+
+def test_forecast_cube(ecmwf_data, tmp_path):
+
+    forecast_folder = ecmwf_data['forecast_folder']
+    dates = (ecmwf_data['begin_date'], ecmwf_data['end_date'])
+    cube = ingest_forecasts(forecast_folder, ['Rain', 'Temp'], *dates, str(tmp_path / 'cube'))
+
+    # Same forecasts as in CSV files, without parsing
+    assert cube.variables == ['Rain', 'Temp']
+    assert cube.values('Rain').shape == (3, 40, 5)
+    assert isinstance(cube.values('Rain'), np.memmap)
+    for t in ecmwf_data['init_dates']:
+        for variable_name in ['Rain', 'Temp']:
+            pd.testing.assert_frame_equal(cube.forecast(t, variable_name), read_forecast(forecast_folder, t,
+                                                                                         variable_name),
+                                          check_freq=False, check_index_type=False)
+
+    # Cubes are sent to other processes without their data
+    assert len(pickle.dumps(cube)) < 1000
+    np.testing.assert_array_equal(pickle.loads(pickle.dumps(cube)).values('Temp'), cube.values('Temp'))
+
+    # Drivers take cubes in place of forecast folders, serially and in parallel
+    skill_values = np.linspace(0, 1, 3)
+    args = (ecmwf_data['history_file'], forecast_folder, ['Rain', 'Rain'], ecmwf_data['family_folder'], skill_values,
+            *dates)
+    with FamilyWriter(str(tmp_path / 'from_csv')) as writer:
+        ecmwf_ensemble_family(*args, writer=writer)
+    for n_workers in [1, 2]:
+        with FamilyWriter(str(tmp_path / 'from_cube')) as writer:
+            ecmwf_ensemble_family(*args[:1], ForecastCube(str(tmp_path / 'cube')), *args[2:], writer=writer,
+                                  n_workers=n_workers)
+        from_csv = FamilyStore(str(tmp_path / 'from_csv'))
+        from_cube = FamilyStore(str(tmp_path / 'from_cube'))
+        for t in ecmwf_data['init_dates']:
+            np.testing.assert_array_equal(from_cube.family(t), from_csv.family(t))
+
+    # Init dates without forecast files are left out
+    with pytest.warns(UserWarning, match='1969-04-01, 1969-05-01'):
+        cube = ingest_forecasts(forecast_folder, ['Rain'], dates[0], '1969/5/1', str(tmp_path / 'partial'))
+    pd.testing.assert_index_equal(cube.init_dates('Rain'), pd.DatetimeIndex(ecmwf_data['init_dates'].values))
+    assert cube.values('Rain').shape == (3, 40, 5)
+    with pytest.raises(FileNotFoundError):
+        ingest_forecasts(forecast_folder, ['Rain'], '1970/1/1', '1970/2/1', str(tmp_path / 'empty'))
+
+    return None
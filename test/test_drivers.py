@@ -0,0 +1,62 @@
+import pandas as pd
+import numpy as np
+import os
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.deterministic import ecmwf_deterministic_family
+from src.drivers import ecmwf_families
+from src.ensemble import ecmwf_ensemble_family
+from src.storage import FamilyWriter, FamilyStore
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_drivers.py`
+"""
+
+
+def test_fused_driver(ecmwf_data, tmp_path):
+
+    skill_values = np.linspace(0, 1, 3)
+    variables = [['Temp', 'Temp'], ['Rain', 'Rain']]
+    separate_folder = ecmwf_data['family_folder']
+    fused_folder = str(tmp_path / 'fused')
+    os.mkdir(fused_folder)
+    dates = (ecmwf_data['begin_date'], ecmwf_data['end_date'])
+
+    # One call per variable and metric
+    for names in variables:
+        args = (ecmwf_data['history_file'], ecmwf_data['forecast_folder'], names, separate_folder, skill_values)
+        ecmwf_ensemble_family(*args, *dates)
+        for metric in ['MAE', 'MSE']:
+            ecmwf_deterministic_family(*args, *dates, metric)
+
+    # A single pass gives the same CSV files, also with worker processes
+    for n_workers in [1, 2]:
+        ecmwf_families(ecmwf_data['history_file'], ecmwf_data['forecast_folder'], variables, fused_folder,
+                       skill_values, *dates, n_workers=n_workers)
+        n_files = 0
+        for root, folders, files in os.walk(separate_folder):
+            for file in files:
+                separate = pd.read_csv(os.path.join(root, file), index_col=0)
+                fused = pd.read_csv(os.path.join(root.replace(separate_folder, fused_folder), file), index_col=0)
+                pd.testing.assert_frame_equal(separate, fused, check_exact=True)
+                n_files += 1
+        assert n_files == 2 * 3 * (3 + 2)
+
+    # Families with a writer are handed over to it rather than written to CSV
+    with FamilyWriter(str(tmp_path / 'store')) as writer:
+        ecmwf_families(ecmwf_data['history_file'], ecmwf_data['forecast_folder'], variables, str(tmp_path / 'other'),
+                       skill_values, *dates, metrics=['CRPSS'], writers={('Rain', 'CRPSS'): writer})
+    store = FamilyStore(str(tmp_path / 'store'))
+    t = ecmwf_data['init_dates'][1]
+    separate = pd.read_csv(separate_folder + '/ECMWF_Ensemble_skill_CRPSS=0.50/' + t.strftime('%Y%m%d') +
+                           '_1d_7m_ECMWF_Rain.csv', index_col=0)
+    np.testing.assert_array_almost_equal(store.member(t, 0.5).values, separate.values, decimal=12)
+    assert not os.path.exists(str(tmp_path / 'other') + '/ECMWF_Ensemble_skill_CRPSS=0.50/' + t.strftime('%Y%m%d') +
+                              '_1d_7m_ECMWF_Rain.csv')
+    assert os.path.exists(str(tmp_path / 'other') + '/ECMWF_Ensemble_skill_CRPSS=0.50/' + t.strftime('%Y%m%d') +
+                          '_1d_7m_ECMWF_Temp.csv')
+
+    return None
@@ -0,0 +1,107 @@
+import pandas as pd
+import numpy as np
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.ensemble import compute_family
+from src.evaluation import crossing_skill, evaluate_families, refine_skill_grid
+from src.forecasts import read_forecast
+from src.history import observation_index
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_evaluation.py`
+"""
+
+
+def reservoir_objective(family, observations):
+    # Reservoir releasing forecast inflows above 2, benefit decreasing with distance to target storage
+    release = np.clip(family - 2, 0, 10)
+    storage = np.clip(100 + np.cumsum(observations - release, axis=-1), 0, 200)
+    return -np.mean((storage - 100) ** 2, axis=-1)
+
+
+def test_evaluate_families(ecmwf_data):
+
+    skill_values = [0, 0.5, 1]
+    args = (ecmwf_data['history_file'], ecmwf_data['forecast_folder'], ['Temp', 'Temp'])
+    dates = (ecmwf_data['begin_date'], ecmwf_data['end_date'])
+
+    # One row per init date, skill value and member, same in serial and in parallel
+    table = evaluate_families(*args, skill_values, *dates, reservoir_objective)
+    assert list(table.columns) == ['init_date', 'skill', 'member', 'benefit']
+    assert len(table) == 3 * 3 * 5
+    pd.testing.assert_frame_equal(table, evaluate_families(*args, skill_values, *dates, reservoir_objective,
+                                                           n_workers=2))
+
+    # Benefits are those of the family members
+    t = ecmwf_data['init_dates'][1]
+    benchmark = read_forecast(ecmwf_data['forecast_folder'], t, 'Temp')
+    observations = observation_index(ecmwf_data['history_file'], 'Temp').window(benchmark.index)
+    member = compute_family(observations, benchmark, [0.5])[0]
+    expected = reservoir_objective(member.T[np.newaxis], observations.values)[0]
+    selected = table[(table['init_date'] == t) & (table['skill'] == 0.5)]
+    np.testing.assert_array_almost_equal(selected['benefit'].values, expected, decimal=10)
+
+    # Cached (init date, skill) pairs are not evaluated again
+    batches = []
+
+    def counting_objective(family, observations):
+        batches.append(family.shape)
+        return reservoir_objective(family, observations)
+    cache = {}
+    evaluate_families(*args, skill_values, *dates, counting_objective, cache=cache)
+    extended = evaluate_families(*args, skill_values + [0.75], *dates, counting_objective, cache=cache)
+    assert batches == [(3, 5, 40)] * 3 + [(1, 5, 40)] * 3
+    pd.testing.assert_frame_equal(extended[extended['skill'] != 0.75].reset_index(drop=True), table)
+
+    # Results of other variables or metrics are not taken from the cache
+    evaluate_families(*args[:2], ['Rain', 'Rain'], skill_values, *dates, counting_objective, cache=cache)
+    assert batches[6:] == [(3, 5, 40)] * 3
+    assert ('Rain', 'CRPSS', t, 0.5) in cache and ('Temp', 'CRPSS', t, 0.5) in cache
+
+    # Deterministic families, with one benefit per skill value: benefit grows with skill
+    def accuracy(family, observations):
+        return -np.mean(np.abs(family[:, 0, :] - observations), axis=-1)
+    table = evaluate_families(*args, skill_values, *dates, accuracy, skill_name='MAE')
+    assert list(table.columns) == ['init_date', 'skill', 'benefit']
+    curve = table.groupby('skill')['benefit'].mean()
+    assert curve.is_monotonic_increasing and curve.loc[1.0] == 0
+
+    return None
+
+
+def test_refine_skill_grid(ecmwf_data):
+
+    args = (ecmwf_data['history_file'], ecmwf_data['forecast_folder'], ['Rain', 'Rain'], ecmwf_data['begin_date'],
+            ecmwf_data['end_date'], reservoir_objective)
+    dense = evaluate_families(*args[:3], np.linspace(0, 1, 101), *args[3:]).groupby('skill')['benefit'].mean()
+
+    # Threshold crossing: same answer as a dense sweep, from a fraction of the skill levels
+    threshold = dense.iloc[0] + 0.6 * (dense.iloc[-1] - dense.iloc[0])
+    cache = {}
+    curve = refine_skill_grid(*args, threshold=threshold, tolerance=0.005, cache=cache)
+    assert curve.index.is_monotonic_increasing and len(curve) < 15
+    assert len(cache) == 3 * len(curve)
+    np.testing.assert_allclose(curve.values, dense.reindex(curve.index, method='nearest').values, rtol=0.2)
+    assert abs(crossing_skill(curve, threshold)[0] - crossing_skill(dense, threshold)[0]) < 0.01
+
+    # Refining where benefit changes: interpolating the refined curve gives the dense curve within tolerance
+    curve = refine_skill_grid(*args, change_tolerance=0.02)
+    assert len(curve) < 25
+    interpolated = np.interp(dense.index.values, curve.index.values, curve.values)
+    assert np.max(np.abs(interpolated - dense.values)) < 0.05 * np.ptp(dense.values)
+
+    # Cached levels are not evaluated again
+    evaluated = []
+
+    def counting_objective(family, observations):
+        evaluated.extend(family.shape[0] * [1])
+        return reservoir_objective(family, observations)
+    first = refine_skill_grid(*args[:5], counting_objective, threshold=threshold, cache=cache)
+    assert len(evaluated) == 0
+    pd.testing.assert_series_equal(first.loc[curve.index.intersection(first.index)],
+                                   curve.loc[curve.index.intersection(first.index)])
+
+    return None
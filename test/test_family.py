@@ -0,0 +1,118 @@
+import pandas as pd
+import numpy as np
+
+import pytest
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.ensemble import compute_family
+from src.deterministic import generate_family
+from src.view import FamilyView
+from src.sites import site_families
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_family.py`
+"""
+
+
+def test_compute_family():
+
+    # Test data
+    observations = pd.Series([1.0, 2.0, 3.0])
+    forecast = pd.DataFrame({'1': [1.5, 0.5, -1.0],
+                             '2': [2.0, 1.0, 3.0],
+                             '3': [2.5, 0.0, 1.0]})
+    skill_values = np.linspace(0, 1, 5)
+
+    family = compute_family(observations, forecast, skill_values)
+
+    # Shape and layout (skill x time x member)
+    assert family.shape == (5, 3, 3)
+    assert family.flags['C_CONTIGUOUS']
+
+    # Zero skill is the benchmark, skill 1 is the observations, and every member is a linear blend
+    np.testing.assert_array_almost_equal(family[0], forecast.values, decimal=12)
+    for j in range(forecast.shape[1]):
+        np.testing.assert_array_almost_equal(family[-1][:, j], observations.values, decimal=12)
+    for i in range(len(skill_values)):
+        k = 1 - skill_values[i]
+        np.testing.assert_array_almost_equal(family[i], (1 - k) * observations.values[:, np.newaxis] +
+                                             k * forecast.values, decimal=12)
+
+    return None
+
+
+def test_family_view():
+
+    # Test data
+    dates = pd.date_range('1969/1/1', periods=4, freq='D')
+    observations = pd.Series([1.0, 2.0, 3.0, 4.0], index=dates)
+    forecast = pd.DataFrame({'1': [1.5, 0.5, -1.0, 2.0],
+                             '2': [2.0, 1.0, 3.0, 5.0],
+                             '3': [2.5, 0.0, 1.0, 4.5]}, index=dates)
+    skill_values = [0, 0.25, 0.75, 1]
+
+    # Ensemble view matches the materialised family
+    view = FamilyView(observations, forecast, 'CRPSS')
+    family = compute_family(observations, forecast, skill_values)
+    np.testing.assert_array_almost_equal(view.sel(skill_values), family, decimal=12)
+    pd.testing.assert_frame_equal(view[0.25], pd.DataFrame(family[1], index=dates, columns=forecast.columns))
+
+    # Slices by date range and member
+    member = view[0.75, '1969/1/2':'1969/1/3', ['1', '3']]
+    assert member.shape == (2, 2)
+    np.testing.assert_array_almost_equal(member.values, family[2, 1:3][:, [0, 2]], decimal=12)
+    np.testing.assert_array_almost_equal(view[skill_values, '1969/1/4'], family[:, 3:4, :], decimal=12)
+    pd.testing.assert_frame_equal(view[0.75, :, '1':'2'], view[0.75, :, ['1', '2']])
+    np.testing.assert_array_almost_equal(view[skill_values, :, '2':], family[:, :, 1:], decimal=12)
+
+    # Deterministic views match deterministic families
+    for skill_name in ['MAE', 'MSE']:
+        benchmark = pd.Series(forecast.mean(axis=1))
+        view = FamilyView(observations, benchmark, skill_name)
+        family = generate_family(observations, benchmark, skill_values, skill_name)
+        for i in range(len(skill_values)):
+            np.testing.assert_array_almost_equal(view[skill_values[i]].values, family.iloc[:, i].values, decimal=12)
+
+    # Metric must match the type of benchmark
+    with pytest.raises(ValueError):
+        FamilyView(observations, forecast, 'MAE')
+    with pytest.raises(ValueError):
+        FamilyView(observations, benchmark, 'CRPSS')
+
+    return None
+
+
+def test_site_families():
+
+    rng = np.random.default_rng(3)
+    dates = pd.date_range('1969/1/1', periods=30, freq='D')
+    sites = pd.DataFrame({'area': [120.0, 35.5, 800.0], 'lat': [51.2, 50.9, 52.4]}, index=['A', 'B', 'C'])
+    observations = pd.DataFrame(np.cumsum(rng.gamma(0.5, 4, (30, 3)), axis=0), index=dates, columns=['C', 'A', 'B'])
+    ensembles = {site: pd.DataFrame(observations[site].values[:, np.newaxis] + rng.normal(0, 4, (30, 7)), index=dates,
+                                    columns=[str(j) for j in range(7)]) for site in sites.index}
+    skill_values = [0, 0.4, 0.8, 1]
+
+    # Ensemble families of all sites at once, same as site by site, with site metadata
+    families = site_families(observations, ensembles, skill_values, 'CRPSS', sites)
+    assert families.values.shape == (4, 3, 30, 7)
+    for site in sites.index:
+        family = compute_family(observations[site], ensembles[site], skill_values)
+        values, metadata = families.site(site)
+        np.testing.assert_array_equal(values, family)
+        assert metadata['area'] == sites.loc[site, 'area']
+        pd.testing.assert_frame_equal(families.member(0.4, site), pd.DataFrame(family[1], index=dates,
+                                                                              columns=ensembles[site].columns))
+
+    # Deterministic families, including a metric solved numerically for each site
+    means = pd.DataFrame({site: ensembles[site].mean(axis=1) for site in sites.index})
+    for skill_name in ['MSE', 'KGE']:
+        families = site_families(observations, means, skill_values, skill_name, sites)
+        assert families.values.shape == (4, 3, 30)
+        for site in sites.index:
+            family = generate_family(observations[site], means[site], skill_values, skill_name)
+            np.testing.assert_array_almost_equal(families.site(site)[0], family.values.T, decimal=10)
+
+    return None
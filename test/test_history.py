@@ -0,0 +1,87 @@
+import pandas as pd
+import numpy as np
+import os
+
+import pytest
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src import history
+from src.history import read_history, clear_history_cache, SIDECAR_SUFFIX, ObservationIndex
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_history.py`
+"""
+
+
+def test_read_history(ecmwf_data, monkeypatch):
+
+    datafile = ecmwf_data['history_file']
+    expected = pd.read_csv(datafile, index_col=0)
+    expected.index = pd.to_datetime(np.array(expected.index), format='%d/%m/%Y')
+
+    # Count how many times the CSV file is parsed
+    parse = history._parse
+    calls = []
+    monkeypatch.setattr(history, '_parse', lambda path: calls.append(path) or parse(path))
+    clear_history_cache()
+
+    # Parsed once, then served from memory
+    hist_all = read_history(datafile)
+    pd.testing.assert_frame_equal(hist_all, expected)
+    assert read_history(datafile) is hist_all
+    assert len(calls) == 1
+
+    # Modified file: parsed again
+    expected.loc[expected.index[0], 'Temp'] = 100.0
+    expected.set_index(expected.index.strftime('%d/%m/%Y')).to_csv(datafile)
+    os.utime(datafile, ns=(0, os.stat(datafile).st_mtime_ns + 10**9))
+    assert read_history(datafile).loc[expected.index[0], 'Temp'] == 100.0
+    assert len(calls) == 2
+
+    # Binary sidecar: written on first read, then used by a fresh process (simulated by clearing the cache)
+    clear_history_cache()
+    read_history(datafile, sidecar=True)
+    assert os.path.exists(datafile + SIDECAR_SUFFIX)
+    clear_history_cache()
+    pd.testing.assert_frame_equal(read_history(datafile, sidecar=True, check_hash=True), expected, check_freq=False,
+                                  check_names=False)
+    assert len(calls) == 3
+
+    return None
+
+
+def test_observation_index():
+
+    # A record with a missing value and three missing dates
+    dates = pd.date_range('2000/1/1', periods=400, freq='D')
+    values = np.random.default_rng(1).gamma(0.5, 4, 400)
+    values[50] = np.nan
+    rain = pd.Series(values, index=dates, name='Rain').drop(dates[100:103])
+    cumulative = ObservationIndex(rain, cumulative=True)
+    daily = ObservationIndex(rain, cumulative=False)
+
+    # Same as a cumulative sum over the window, including missing values
+    window = pd.date_range('2000/2/1', periods=60, freq='D')
+    np.testing.assert_array_almost_equal(cumulative.window(window).values, rain.loc[window].cumsum().values, decimal=10)
+    np.testing.assert_array_equal(daily.window(window).values, rain.loc[window].values)
+
+    # Missing dates raise an error, or are NaN on demand
+    window = pd.date_range('2000/4/1', periods=30, freq='D')
+    with pytest.raises(KeyError):
+        cumulative.window(window)
+    np.testing.assert_array_almost_equal(cumulative.window(window, missing='nan').values,
+                                         rain.reindex(window).cumsum().values, decimal=10)
+
+    # Many windows at once
+    init_dates = pd.date_range('2000/1/1', periods=12, freq='MS')
+    windows = cumulative.windows(init_dates, 35)
+    assert windows.shape == (12, 35)
+    for i in range(len(init_dates)):
+        window = pd.date_range(init_dates[i], periods=35, freq='D')
+        np.testing.assert_array_almost_equal(windows[i], rain.reindex(window).cumsum().values, decimal=10)
+        np.testing.assert_array_equal(daily.windows(init_dates, 35)[i], rain.reindex(window).values)
+
+    return None
@@ -0,0 +1,89 @@
+import pandas as pd
+import numpy as np
+import os
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.deterministic import ecmwf_deterministic_family
+from src.ensemble import ecmwf_ensemble_family
+from src.manifest import Manifest
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_manifest.py`
+"""
+
+
+def test_manifest(ecmwf_data, tmp_path):
+
+    manifest_file = str(tmp_path / 'manifest.jsonl')
+    family_folder = ecmwf_data['family_folder']
+    args = (ecmwf_data['history_file'], ecmwf_data['forecast_folder'], ['Temp', 'Temp'], family_folder)
+    dates = (ecmwf_data['begin_date'], ecmwf_data['end_date'])
+
+    def modification_times():
+        times = {}
+        for root, folders, files in os.walk(family_folder):
+            for file in files:
+                times[os.path.join(root, file)] = os.stat(os.path.join(root, file)).st_mtime_ns
+        return times
+
+    # First run: everything is generated and recorded
+    ecmwf_ensemble_family(*args, np.array([0, 0.5]), *dates, manifest=manifest_file)
+    ecmwf_deterministic_family(*args, np.array([0, 0.5]), *dates, 'MAE', manifest=manifest_file)
+    assert len(Manifest(manifest_file)) == 3 * 2 * 2
+    first_run = modification_times()
+    assert len(first_run) == 3 * 2 + 3
+
+    # Same run again: nothing is written
+    ecmwf_ensemble_family(*args, np.array([0, 0.5]), *dates, manifest=manifest_file)
+    ecmwf_deterministic_family(*args, np.array([0, 0.5]), *dates, 'MAE', manifest=manifest_file)
+    assert modification_times() == first_run
+
+    # New skill value: only the new ensemble family members are written
+    ecmwf_ensemble_family(*args, np.array([0, 0.5, 1]), *dates, manifest=Manifest(manifest_file))
+    second_run = modification_times()
+    assert len(second_run) == 3 * 3 + 3
+    assert all(second_run[file] == first_run[file] for file in first_run)
+
+    # Modified forecast, or deleted output: only the corresponding init date is generated again
+    forecast_file = ecmwf_data['forecast_folder'] + '/19690201_1d_7m_ECMWF_Temp.csv'
+    with open(forecast_file, 'a') as f:
+        f.write('\n')
+    os.remove(family_folder + '/ECMWF_Ensemble_skill_CRPSS=0.50/19690301_1d_7m_ECMWF_Temp.csv')
+    ecmwf_ensemble_family(*args, np.array([0, 0.5, 1]), *dates, manifest=manifest_file)
+    third_run = modification_times()
+    changed = sorted(os.path.basename(os.path.dirname(file)) + '/' + os.path.basename(file)[:8]
+                     for file in third_run if third_run[file] != second_run.get(file))
+    assert changed == ['ECMWF_Ensemble_skill_CRPSS=0.00/19690201', 'ECMWF_Ensemble_skill_CRPSS=0.50/19690201',
+                       'ECMWF_Ensemble_skill_CRPSS=0.50/19690301', 'ECMWF_Ensemble_skill_CRPSS=1.00/19690201']
+
+    # Other precision or CSV format: outputs are generated again, in both drivers and in pipeline mode
+    ecmwf_ensemble_family(*args, np.array([0, 0.5, 1]), *dates, manifest=manifest_file, dtype=np.float32,
+                          float_format='%.1f', pipeline=True)
+    ecmwf_deterministic_family(*args, np.array([0, 0.5]), *dates, 'MAE', manifest=manifest_file, float_format='%.1f')
+    fourth_run = modification_times()
+    assert all(fourth_run[file] != third_run[file] for file in third_run)
+    with open(family_folder + '/ECMWF_Ensemble_skill_CRPSS=0.50/19690101_1d_7m_ECMWF_Temp.csv') as f:
+        f.readline()
+        assert all(len(value.split('.')[1]) == 1 for value in f.readline().strip().split(',')[1:])
+
+    # Same options again: nothing is written; back to defaults: generated again
+    ecmwf_ensemble_family(*args, np.array([0, 0.5, 1]), *dates, manifest=manifest_file, dtype=np.float32,
+                          float_format='%.1f')
+    assert modification_times() == fourth_run
+    ecmwf_ensemble_family(*args, np.array([0, 0.5, 1]), *dates, manifest=manifest_file, dtype=np.float64)
+    fifth_run = modification_times()
+    assert sum(fifth_run[file] != fourth_run[file] for file in fourth_run) == 3 * 3
+
+    # Deterministic families share one file per init date: it is generated again whenever skill values change
+    output = family_folder + '/19690101_1d_7m_ECMWF_Temp_MAE_Family.csv'
+    for skill_values in [[0, 1], [0.5], [0, 0.5, 1]]:
+        ecmwf_deterministic_family(*args, np.array(skill_values), dates[0], dates[0], 'MAE', manifest=manifest_file)
+        assert len(pd.read_csv(output, index_col=0).columns) == len(skill_values)
+    last_run = modification_times()
+    ecmwf_deterministic_family(*args, np.array([0, 0.5, 1]), dates[0], dates[0], 'MAE', manifest=manifest_file)
+    assert modification_times() == last_run
+
+    return None
@@ -0,0 +1,50 @@
+import pandas as pd
+import numpy as np
+import os
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.deterministic import ecmwf_deterministic_family
+from src.ensemble import ecmwf_ensemble_family
+from src.storage import FamilyWriter, FamilyStore
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_parallel.py`
+"""
+
+
+def test_parallel_drivers(ecmwf_data, tmp_path):
+
+    skill_values = np.linspace(0, 1, 4)
+    serial_folder = ecmwf_data['family_folder']
+    parallel_folder = str(tmp_path / 'parallel')
+    os.mkdir(parallel_folder)
+
+    def run(family_folder, n_workers, **kwargs):
+        args = (ecmwf_data['history_file'], ecmwf_data['forecast_folder'], ['Temp', 'Temp'], family_folder,
+                skill_values, ecmwf_data['begin_date'], ecmwf_data['end_date'])
+        ecmwf_ensemble_family(*args, n_workers=n_workers, **kwargs)
+        ecmwf_deterministic_family(*args, 'MAE', n_workers=n_workers)
+
+    # CSV outputs written by worker processes are the same as those of a serial run
+    run(serial_folder, 1)
+    run(parallel_folder, 2)
+    for root, folders, files in os.walk(serial_folder):
+        for file in files:
+            serial = pd.read_csv(os.path.join(root, file), index_col=0)
+            parallel = pd.read_csv(os.path.join(root.replace(serial_folder, parallel_folder), file), index_col=0)
+            pd.testing.assert_frame_equal(serial, parallel, check_exact=True)
+
+    # Families handed over to a writer by worker processes come back in date order
+    with FamilyWriter(str(tmp_path / 'store')) as writer:
+        run(serial_folder, 3, writer=writer)
+    store = FamilyStore(str(tmp_path / 'store'))
+    np.testing.assert_array_equal(store.init_dates, ecmwf_data['init_dates'])
+    for t in store.init_dates:
+        serial = pd.read_csv(serial_folder + '/ECMWF_Ensemble_skill_CRPSS=0.33/' + t.strftime('%Y%m%d') +
+                             '_1d_7m_ECMWF_Temp.csv', index_col=0)
+        np.testing.assert_array_almost_equal(store.member(t, skill_values[1]).values, serial.values, decimal=12)
+
+    return None
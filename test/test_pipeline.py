@@ -0,0 +1,136 @@
+import pandas as pd
+import numpy as np
+import os
+
+import pytest
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.ensemble import ecmwf_ensemble_family
+from src.manifest import Manifest
+from src.pipeline import BackgroundWriter, prefetch
+from src.profiling import StageProfiler
+from src.storage import FamilyWriter, FamilyStore
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_pipeline.py`
+"""
+
+
+class FailingWriter:
+
+    # Writer failing on its second init date
+    def __init__(self):
+        self.init_dates = []
+
+    def write(self, init_date, family, lead_dates, members, skill_values):
+        if len(self.init_dates) == 1:
+            raise IOError("disk full")
+        self.init_dates.append(init_date)
+
+
+def test_pipelined_driver(ecmwf_data, tmp_path):
+
+    skill_values = np.linspace(0, 1, 5)
+    sequential_folder = ecmwf_data['family_folder']
+    pipelined_folder = str(tmp_path / 'pipelined')
+    os.mkdir(pipelined_folder)
+
+    def run(family_folder, **kwargs):
+        ecmwf_ensemble_family(ecmwf_data['history_file'], ecmwf_data['forecast_folder'], ['Rain', 'Rain'],
+                              family_folder, skill_values, ecmwf_data['begin_date'], ecmwf_data['end_date'], **kwargs)
+
+    # Same CSV files as a sequential run
+    run(sequential_folder)
+    run(pipelined_folder, pipeline=True, queue_size=1)
+    n_files = 0
+    for root, folders, files in os.walk(sequential_folder):
+        for file in files:
+            sequential = pd.read_csv(os.path.join(root, file), index_col=0)
+            pipelined = pd.read_csv(os.path.join(root.replace(sequential_folder, pipelined_folder), file), index_col=0)
+            pd.testing.assert_frame_equal(sequential, pipelined, check_exact=True)
+            n_files += 1
+    assert n_files == 5 * 3
+
+    # Same family store, in date order
+    for name, pipeline in [('sequential', False), ('pipelined', True)]:
+        with FamilyWriter(str(tmp_path / name)) as writer:
+            run(None, writer=writer, pipeline=pipeline)
+    sequential, pipelined = FamilyStore(str(tmp_path / 'sequential')), FamilyStore(str(tmp_path / 'pipelined'))
+    np.testing.assert_array_equal(pipelined.init_dates, ecmwf_data['init_dates'])
+    for t in ecmwf_data['init_dates']:
+        np.testing.assert_array_equal(sequential.family(t), pipelined.family(t))
+
+    # Manifest records are written after their outputs, with the path of their own init date
+    manifest = Manifest(str(tmp_path / 'manifest.jsonl'))
+    run(str(tmp_path / 'resumed'), pipeline=True, manifest=manifest)
+    assert len(manifest) == 5 * 3
+    assert len(manifest.pending(ecmwf_data['init_dates'], ecmwf_data['history_file'],
+                                ecmwf_data['forecast_folder'], ['Rain', 'Rain'], 'CRPSS', skill_values,
+                                lambda t, skill: str(tmp_path / 'resumed') + '/ECMWF_Ensemble_skill_CRPSS=' +
+                                str("%.2f" % skill) + '/' + t.strftime('%Y%m%d') + '_1d_7m_ECMWF_Rain.csv')) == 0
+
+    # Write errors reach the caller, and stop the run
+    writer = FailingWriter()
+    with pytest.raises(IOError, match='disk full'):
+        run(None, writer=writer, pipeline=True, queue_size=1)
+    assert writer.init_dates == [ecmwf_data['init_dates'][0]]
+
+    # Pipeline mode is serial
+    with pytest.raises(ValueError):
+        run(pipelined_folder, pipeline=True, n_workers=2)
+
+    # Stages are timed, but memory peaks cannot be traced across threads
+    os.mkdir(str(tmp_path / 'timed'))
+    with StageProfiler(memory=False) as profiler:
+        run(str(tmp_path / 'timed'), pipeline=True, profiler=profiler)
+    assert set(profiler.to_frame()['stage']) >= {'read_csv', 'compute_family'}
+    with StageProfiler() as profiler:
+        with pytest.raises(ValueError):
+            run(pipelined_folder, pipeline=True, profiler=profiler)
+    assert len(profiler.records) == 0
+
+    return None
+
+
+def test_pipeline_stages():
+
+    # Read-ahead keeps order, and raises errors where results are consumed
+    assert list(prefetch(lambda x: x ** 2, range(10), queue_size=2)) == [(x, x ** 2) for x in range(10)]
+
+    def read(x):
+        if x == 3:
+            raise KeyError(x)
+        return x
+    consumed = []
+    with pytest.raises(KeyError):
+        for x, result in prefetch(read, range(10)):
+            consumed.append(result)
+    assert consumed == [0, 1, 2]
+
+    # Consumers can stop early
+    for x, result in prefetch(read, range(10)):
+        break
+
+    # Background writes run in order; after a failure, the rest is skipped and the error raised on close
+    written = []
+    background = BackgroundWriter(queue_size=2)
+    for x in range(20):
+        background.submit(written.append, x)
+    background.close()
+    assert written == list(range(20))
+
+    def write(x):
+        if x == 5:
+            raise OSError("cannot write " + str(x))
+        written.append(x)
+    written = []
+    with pytest.raises(OSError, match='cannot write 5'):
+        with BackgroundWriter(queue_size=2) as background:
+            for x in range(10):
+                background.submit(write, x)
+    assert written == [0, 1, 2, 3, 4]
+
+    return None
@@ -0,0 +1,68 @@
+import pandas as pd
+import os
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src import deterministic
+from src.ensemble import compute_family, ecmwf_ensemble_family, plot_family
+from src.forecasts import ingest_forecasts, read_forecast
+from src.history import observation_index
+from src.plots import plot_hindcast, render_family
+from src.storage import FamilyWriter
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_plots.py`
+"""
+
+
+def test_batch_plots(ecmwf_data, tmp_path):
+
+    skill_values = [0, 0.5, 1]
+    t = ecmwf_data['init_dates'][0]
+    benchmark = read_forecast(ecmwf_data['forecast_folder'], t, 'Rain')
+    observations = observation_index(ecmwf_data['history_file'], 'Rain').window(benchmark.index)
+    family = compute_family(observations, benchmark, skill_values)
+
+    # One PNG file per skill value, from a single figure
+    paths = render_family(observations, benchmark, family, skill_values, str(tmp_path / 'single'))
+    assert [os.path.basename(path) for path in paths] == ['family_CRPSS=0.png', 'family_CRPSS=0.5.png',
+                                                          'family_CRPSS=1.png']
+    assert all(os.path.getsize(path) > 0 for path in paths)
+
+    # Figures of plot_family are closed once saved, also with a family in memory
+    n_figures = len(plt.get_fignums())
+    plot_family(ecmwf_data['history_file'], benchmark, None, skill_values, 'Rain', str(tmp_path / 'pyplot'),
+                family=family)
+    assert len(plt.get_fignums()) == n_figures
+    assert sorted(os.listdir(str(tmp_path / 'pyplot'))) == sorted(os.path.basename(path) for path in paths)
+
+    # Benchmark forecasts read from a forecast cube, at an init date
+    cube = ingest_forecasts(ecmwf_data['forecast_folder'], ['Rain'], ecmwf_data['begin_date'], ecmwf_data['end_date'],
+                            str(tmp_path / 'cube'))
+    plot_family(ecmwf_data['history_file'], cube, None, skill_values, 'Rain', str(tmp_path / 'from_cube'),
+                family=family, init_date=t)
+    assert sorted(os.listdir(str(tmp_path / 'from_cube'))) == sorted(os.listdir(str(tmp_path / 'pyplot')))
+    skill_specs = pd.DataFrame({'value': skill_values, 'stringvalue': ['0', '0.5', '1'],
+                                'color': ['black', 'red', 'blue'], 'linestyle': ['-', '--', ':']})
+    deterministic.plot_family(ecmwf_data['history_file'], cube, 'Rain', 'MAE', skill_specs, str(tmp_path / 'mae'),
+                              init_date=t)
+    assert os.listdir(str(tmp_path / 'mae')) == ['family_MAE.png']
+
+    # Whole hindcast from a family store, in worker processes
+    with FamilyWriter(str(tmp_path / 'store')) as writer:
+        ecmwf_ensemble_family(ecmwf_data['history_file'], ecmwf_data['forecast_folder'], ['Rain', 'Rain'],
+                              ecmwf_data['family_folder'], skill_values, ecmwf_data['begin_date'],
+                              ecmwf_data['end_date'], writer=writer)
+    figures = plot_hindcast(ecmwf_data['history_file'], ecmwf_data['forecast_folder'], ['Rain', 'Rain'],
+                            str(tmp_path / 'store'), str(tmp_path / 'hindcast'), [0.5, 1], n_workers=2)
+    assert list(figures) == list(ecmwf_data['init_dates'])
+    for t in figures:
+        assert len(figures[t]) == 2
+        assert all(os.path.exists(path) for path in figures[t])
+
+    return None
@@ -0,0 +1,105 @@
+import pandas as pd
+import numpy as np
+import os
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src import deterministic, ensemble
+from src.forecasts import read_forecast
+from src.history import observation_index
+from src.sites import site_families
+from src.storage import FamilyWriter, FamilyStore
+from src.stream import stream_families
+from src.verification import verify_family
+from src.view import FamilyView
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_precision.py`
+"""
+
+
+def test_float32_families():
+
+    rng = np.random.default_rng(7)
+    observations = np.cumsum(rng.gamma(0.5, 4, 215))
+    benchmark = observations[:, np.newaxis] + rng.normal(0, 10, (215, 51))
+    skill_values = [0, 0.25, 0.5, 0.75, 1]
+
+    # Ensemble families: half the memory, within float32 rounding, exact at skill 0 and 1
+    full = ensemble.compute_family(observations, benchmark, skill_values)
+    compact = ensemble.compute_family(observations, benchmark, skill_values, dtype=np.float32)
+    assert compact.dtype == np.float32 and compact.nbytes == full.nbytes // 2
+    np.testing.assert_allclose(compact, full, rtol=1e-6, atol=1e-6 * np.abs(full).max())
+    np.testing.assert_array_equal(compact[0], benchmark.astype(np.float32))
+    np.testing.assert_array_equal(compact[-1], np.repeat(observations.astype(np.float32)[:, np.newaxis], 51, axis=1))
+    assert np.abs(verify_family(compact, observations, benchmark, skill_values)['error']).max() < 1e-5
+
+    # Deterministic families, with closed-form and numerically solved multipliers
+    mean = benchmark.mean(axis=1)
+    for skill_name in ['MAE', 'MSE', 'KGE']:
+        full = deterministic.compute_family(observations, mean, skill_values, skill_name)
+        compact = deterministic.compute_family(observations, mean, skill_values, skill_name, np.float32)
+        assert compact.dtype == np.float32
+        np.testing.assert_allclose(compact, full, rtol=1e-6, atol=1e-6 * np.abs(full).max())
+        np.testing.assert_array_equal(compact[0], mean.astype(np.float32))
+        np.testing.assert_array_equal(compact[-1], observations.astype(np.float32))
+
+    return None
+
+
+def test_float32_outputs(ecmwf_data, tmp_path):
+
+    skill_values = [0, 0.5, 1]
+    args = (ecmwf_data['history_file'], ecmwf_data['forecast_folder'], ['Rain', 'Rain'])
+    dates = (ecmwf_data['begin_date'], ecmwf_data['end_date'])
+    t = ecmwf_data['init_dates'][0]
+    benchmark = read_forecast(ecmwf_data['forecast_folder'], t, 'Rain')
+    observations = observation_index(ecmwf_data['history_file'], 'Rain').window(benchmark.index)
+
+    # CSV outputs are smaller, and read back to the float32 family
+    for dtype in [None, np.float32]:
+        os.mkdir(str(tmp_path / str(dtype)))
+        ensemble.ecmwf_ensemble_family(*args, str(tmp_path / str(dtype)), skill_values, *dates, dtype=dtype)
+    name = '/ECMWF_Ensemble_skill_CRPSS=0.50/19690101_1d_7m_ECMWF_Rain.csv'
+    assert os.path.getsize(str(tmp_path / 'None') + name) > os.path.getsize(str(tmp_path / str(np.float32)) + name)
+    family = ensemble.compute_family(observations, benchmark, skill_values, dtype=np.float32)
+    for i, folder in enumerate(['0.00', '0.50', '1.00']):
+        written = pd.read_csv(str(tmp_path / str(np.float32)) + '/ECMWF_Ensemble_skill_CRPSS=' + folder +
+                              '/19690101_1d_7m_ECMWF_Rain.csv', index_col=0)
+        np.testing.assert_array_equal(written.values.astype(np.float32), family[i])
+
+    # Fixed number of decimals
+    os.mkdir(str(tmp_path / 'rounded'))
+    deterministic.ecmwf_deterministic_family(*args, str(tmp_path / 'rounded'), skill_values, *dates, 'MAE',
+                                             float_format='%.2f')
+    with open(str(tmp_path / 'rounded') + '/19690101_1d_7m_ECMWF_Rain_MAE_Family.csv') as f:
+        f.readline()
+        assert all(len(value.split('.')[1]) == 2 for value in f.readline().strip().split(',')[1:])
+
+    # Family stores hold float32 values, whether families are generated in float32 or converted on writing
+    with FamilyWriter(str(tmp_path / 'store32')) as writer:
+        ensemble.ecmwf_ensemble_family(*args, None, skill_values, *dates, writer=writer, dtype=np.float32)
+    with FamilyWriter(str(tmp_path / 'converted'), dtype=np.float32) as writer:
+        ensemble.ecmwf_ensemble_family(*args, None, skill_values, *dates, writer=writer)
+    store, converted = FamilyStore(str(tmp_path / 'store32')), FamilyStore(str(tmp_path / 'converted'))
+    assert store.dtype == np.float32 and converted.dtype == np.float32
+    np.testing.assert_array_equal(store.family(t), family)
+    np.testing.assert_allclose(converted.family(t), family, rtol=1e-6)
+    assert os.path.getsize(str(tmp_path / 'store32' / 'values.bin')) == 3 * 3 * 40 * 5 * 4
+
+    # Other entry points carry the dtype through
+    os.mkdir(str(tmp_path / 'generated'))
+    ensemble.generate_family(observations, benchmark, skill_values, str(tmp_path / 'generated') + '/CRPSS=', True,
+                             'out', dtype=np.float32, float_format='%.2f')
+    with open(str(tmp_path / 'generated') + '/CRPSS=0.50/out.csv') as f:
+        f.readline()
+        assert all(len(value.split('.')[1]) == 2 for value in f.readline().strip().split(',')[1:])
+    np.testing.assert_array_equal(FamilyView(observations, benchmark, dtype=np.float32).sel(skill_values), family)
+    block = next(stream_families(*args, skill_values, *dates, dtype=np.float32))
+    np.testing.assert_array_equal(block.values, family)
+    sites = site_families(observations.to_frame('a'), {'a': benchmark}, skill_values, dtype=np.float32)
+    np.testing.assert_array_equal(sites.site('a')[0], family)
+
+    return None
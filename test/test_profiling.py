@@ -0,0 +1,70 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.deterministic import ecmwf_deterministic_family
+from src.ensemble import ecmwf_ensemble_family, generate_family
+from src.forecasts import read_forecast
+from src.history import clear_history_cache
+from src.profiling import StageProfiler
+from src.storage import FamilyWriter
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_profiling.py`
+"""
+
+
+def test_driver_profiling(ecmwf_data, tmp_path):
+
+    skill_values = [0, 0.5, 1]
+    args = (ecmwf_data['history_file'], ecmwf_data['forecast_folder'], ['Rain', 'Rain'], ecmwf_data['family_folder'],
+            skill_values, ecmwf_data['begin_date'], ecmwf_data['end_date'])
+    per_date = ['read_csv', 'parse_dates', 'align_history', 'compute_family', 'write_csv']
+
+    # Every stage of every init date is recorded, also from worker processes
+    clear_history_cache()
+    for n_workers in [1, 2]:
+        with StageProfiler() as profiler:
+            ecmwf_ensemble_family(*args, n_workers=n_workers, profiler=profiler)
+        frame = profiler.to_frame()
+        assert list(frame['stage']) == ['read_history'] + per_date * 3
+        assert list(frame['init_date'].dropna().unique()) == ['1969-01-01', '1969-02-01', '1969-03-01']
+        assert (frame['seconds'] >= 0).all() and (frame['peak_bytes'] >= 0).all()
+        history_bytes = 0 if n_workers == 2 else os.path.getsize(ecmwf_data['history_file'])
+        assert frame['bytes_read'].iloc[0] == history_bytes  # Cached in memory after the first run
+        reads = frame[frame['stage'] == 'read_csv']
+        assert reads['bytes_read'].iloc[0] == os.path.getsize(ecmwf_data['forecast_folder'] +
+                                                              '/19690101_1d_7m_ECMWF_Rain.csv')
+        assert (frame.loc[frame['stage'] == 'write_csv', 'bytes_written'] > 0).all()
+
+    # Deterministic driver, with a writer, without memory tracing
+    profiler = StageProfiler(memory=False)
+    with FamilyWriter(str(tmp_path / 'store')) as writer:
+        ecmwf_deterministic_family(*args, 'MAE', writer=writer, profiler=profiler)
+    summary = profiler.summary()
+    assert summary.loc['write', 'calls'] == 3
+    assert summary.loc['write', 'bytes_written'] == 3 * 3 * 40 * 8
+    assert summary.loc['ensemble_average', 'calls'] == 3
+    assert profiler.to_frame()['peak_bytes'].isnull().all()
+
+    # Export
+    profiler.to_json(str(tmp_path / 'profile.json'))
+    profiler.to_csv(str(tmp_path / 'profile.csv'))
+    with open(str(tmp_path / 'profile.json')) as f:
+        assert json.load(f) == profiler.records
+    columns = ['init_date', 'stage', 'seconds', 'bytes_read', 'bytes_written']
+    pd.testing.assert_frame_equal(pd.read_csv(str(tmp_path / 'profile.csv'))[columns], profiler.to_frame()[columns])
+
+    # generate_family
+    benchmark = read_forecast(ecmwf_data['forecast_folder'], ecmwf_data['init_dates'][0], 'Temp')
+    with StageProfiler() as profiler:
+        generate_family(pd.Series(np.zeros(40)), benchmark, skill_values, str(tmp_path / 'family'), False, 'Temp',
+                        profiler=profiler)
+    assert [record['stage'] for record in profiler.records] == ['compute_family', 'write_csv']
+
+    return None
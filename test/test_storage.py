@@ -0,0 +1,77 @@
+import pandas as pd
+import numpy as np
+
+import pytest
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.deterministic import ecmwf_deterministic_family
+from src.ensemble import ecmwf_ensemble_family
+from src.storage import FamilyWriter, FamilyStore
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_storage.py`
+"""
+
+
+def test_family_store(ecmwf_data, tmp_path):
+
+    skill_values = np.linspace(0, 1, 6)
+    args = (ecmwf_data['history_file'], ecmwf_data['forecast_folder'], ['Rain', 'Rain'], ecmwf_data['family_folder'],
+            skill_values, ecmwf_data['begin_date'], ecmwf_data['end_date'])
+
+    # Ensemble families, both to CSV and to a family store
+    ecmwf_ensemble_family(*args)
+    with FamilyWriter(str(tmp_path / 'store')) as writer:
+        ecmwf_ensemble_family(*args, writer=writer)
+    store = FamilyStore(str(tmp_path / 'store'))
+
+    assert len(store) == 3
+    np.testing.assert_array_equal(store.init_dates, ecmwf_data['init_dates'])
+    for t in ecmwf_data['init_dates']:
+        family = store.family(t)
+        assert family.shape == (6, 40, 5)
+        assert isinstance(family, np.memmap)
+        for i in range(len(skill_values)):
+            from_csv = pd.read_csv(ecmwf_data['family_folder'] + '/ECMWF_Ensemble_skill_CRPSS=' +
+                                   str("%.2f" % skill_values[i]) + '/' + t.strftime('%Y%m%d') + '_1d_7m_ECMWF_Rain.csv',
+                                   index_col=0)
+            np.testing.assert_array_almost_equal(family[i], from_csv.values, decimal=12)
+        member = store.member(t, 0.4)
+        np.testing.assert_array_equal(member.index, pd.date_range(t, periods=40, freq='D'))
+        np.testing.assert_array_equal(member.values, family[2])
+        np.testing.assert_array_equal(store.sel(t, [0.2, 1], ['2', '5']), family[[1, 5]][:, :, [1, 4]])
+
+        # Lead date ranges and evenly spaced selections are views of the memory map, others are copies
+        lead_dates = pd.date_range(t, periods=40, freq='D')
+        window = store.sel(t, [0.2, 0.4, 0.6], ['1', '2'], lead_dates[5], lead_dates[9])
+        np.testing.assert_array_equal(window, family[1:4, 5:10, 0:2])
+        assert np.shares_memory(window, family)
+        assert not np.shares_memory(store.sel(t, [0, 0.2, 1]), family)
+        np.testing.assert_array_equal(store.sel(t, [0, 0.2, 1]), family[[0, 1, 5]])
+        assert store.sel(t, start=lead_dates[-1] + pd.Timedelta(days=1)).shape == (6, 0, 5)
+        member = store.member(t, 0.4, start=lead_dates[30])
+        np.testing.assert_array_equal(member.index, lead_dates[30:])
+        np.testing.assert_array_equal(member.values, family[2, 30:])
+        assert np.shares_memory(member.values, family)
+
+    # Deterministic families
+    ecmwf_deterministic_family(*args, 'MSE')
+    with FamilyWriter(str(tmp_path / 'store_mse')) as writer:
+        ecmwf_deterministic_family(*args, 'MSE', writer=writer)
+    store = FamilyStore(str(tmp_path / 'store_mse'))
+    for t in ecmwf_data['init_dates']:
+        from_csv = pd.read_csv(ecmwf_data['family_folder'] + '/' + t.strftime('%Y%m%d') +
+                               '_1d_7m_ECMWF_Rain_MSE_Family.csv', index_col=0)
+        np.testing.assert_array_almost_equal(store.family(t)[:, :, 0].T, from_csv.values, decimal=12)
+
+    # An overwritten store has no index until its writer is closed
+    writer = FamilyWriter(str(tmp_path / 'store_mse'))
+    with pytest.raises(FileNotFoundError):
+        FamilyStore(str(tmp_path / 'store_mse'))
+    writer.close()
+    assert len(FamilyStore(str(tmp_path / 'store_mse')).init_dates) == 0
+
+    return None
@@ -0,0 +1,62 @@
+import pandas as pd
+import numpy as np
+
+import pytest
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.deterministic import ecmwf_deterministic_family
+from src.ensemble import ecmwf_ensemble_family
+from src.storage import FamilyWriter, FamilyStore
+from src.stream import family_blocks, stream_families
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_stream.py`
+"""
+
+
+def test_stream_families(ecmwf_data, tmp_path):
+
+    skill_values = np.linspace(0, 1, 5)
+    args = (ecmwf_data['history_file'], ecmwf_data['forecast_folder'], ['Rain', 'Rain'])
+    dates = (ecmwf_data['begin_date'], ecmwf_data['end_date'])
+
+    # Reference: families from the ECMWF drivers
+    with FamilyWriter(str(tmp_path / 'ensemble')) as writer:
+        ecmwf_ensemble_family(*args, ecmwf_data['family_folder'], skill_values, *dates, writer=writer)
+    with FamilyWriter(str(tmp_path / 'mse')) as writer:
+        ecmwf_deterministic_family(*args, ecmwf_data['family_folder'], skill_values, *dates, 'MSE', writer=writer)
+
+    for skill_name, store_name in [('CRPSS', 'ensemble'), ('MSE', 'mse')]:
+        store = FamilyStore(str(tmp_path / store_name))
+
+        # One block per init date
+        blocks = list(stream_families(*args, skill_values, *dates, skill_name=skill_name))
+        assert [block.init_date for block in blocks] == list(ecmwf_data['init_dates'])
+        for block in blocks:
+            np.testing.assert_array_equal(block.values, store.family(block.init_date))
+            np.testing.assert_array_equal(block.lead_dates, store.lead_dates(block.init_date))
+
+        # Blocks of 15 lead days: 40 days in 3 blocks per init date
+        blocks = list(stream_families(*args, skill_values, *dates, skill_name=skill_name, lead_block=15))
+        assert len(blocks) == 9
+        assert [block.values.shape[1] for block in blocks[:3]] == [15, 15, 10]
+        for t in ecmwf_data['init_dates']:
+            values = np.concatenate([block.values for block in blocks if block.init_date == t], axis=1)
+            np.testing.assert_array_equal(values, store.family(t))
+
+    # Multipliers solved numerically on whole forecasts: blocks put together give the whole families
+    whole = list(stream_families(*args, skill_values[:-1], *dates, skill_name='KGE'))
+    blocks = list(stream_families(*args, skill_values[:-1], *dates, skill_name='KGE', lead_block=15))
+    for block in whole:
+        values = np.concatenate([b.values for b in blocks if b.init_date == block.init_date], axis=1)
+        np.testing.assert_array_equal(values, block.values)
+
+    # Metric must match the kind of benchmark
+    benchmark = pd.DataFrame(np.ones((10, 3)), index=pd.date_range('1969/1/1', periods=10))
+    with pytest.raises(ValueError):
+        list(family_blocks(benchmark.index[0], pd.Series(np.zeros(10)), benchmark, skill_values, 'MSE'))
+
+    return None
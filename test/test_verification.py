@@ -0,0 +1,96 @@
+import pandas as pd
+import numpy as np
+
+import sys
+sys.path.append('../')
+sys.path.append('.')
+
+from src.ensemble import compute_family
+from src.deterministic import generate_family
+from src.verification import crps, verify_family
+from src import multiplier
+from src.multiplier import achieved_skill, clear_multiplier_cache, skill_to_multiplier, solve_multiplier
+
+"""
+Test with pytest from main directory: enter in command line `pytest test/test_verification.py`
+"""
+
+
+def test_crps():
+
+    rng = np.random.default_rng(0)
+    ensemble = rng.normal(0, 1, (4, 30, 11))
+    observations = rng.normal(0, 1, (4, 30))
+
+    # Same as the pairwise definition
+    pairwise = np.mean(np.abs(ensemble - observations[..., np.newaxis]), axis=-1) - \
+        np.sum(np.abs(ensemble[..., :, np.newaxis] - ensemble[..., np.newaxis, :]), axis=(-2, -1)) / (2 * 11 ** 2)
+    np.testing.assert_array_almost_equal(crps(ensemble, observations), pairwise, decimal=12)
+
+    # A single member is the absolute error
+    np.testing.assert_array_almost_equal(crps(ensemble[..., :1], observations),
+                                         np.abs(ensemble[..., 0] - observations), decimal=12)
+
+    return None
+
+
+def test_verify_family():
+
+    rng = np.random.default_rng(1)
+    skill_values = np.linspace(0, 1, 11)
+    observations = np.cumsum(rng.gamma(0.5, 4, (6, 50)), axis=1)
+    benchmark = observations[..., np.newaxis] + rng.normal(0, 5, (6, 50, 9))
+
+    # Ensemble families for 6 init dates, verified in one pass
+    family = np.stack([compute_family(observations[i], benchmark[i], skill_values) for i in range(6)], axis=1)
+    report = verify_family(family, observations, benchmark, skill_values, 'CRPSS')
+    assert list(report.columns) == ['target', 'achieved', 'error']
+    np.testing.assert_array_almost_equal(report['achieved'].values, skill_values, decimal=10)
+
+    # Deterministic families, on any registered metric
+    for skill_name in ['MAE', 'MSE', 'RMSE', 'NSE', 'KGE', 'logNSE']:
+        mean = np.abs(benchmark.mean(axis=-1))
+        family = np.stack([generate_family(pd.Series(observations[i]), pd.Series(mean[i]), skill_values,
+                                           skill_name).values.T for i in range(6)], axis=1)
+        report = verify_family(family, observations, mean, skill_values, skill_name)
+        np.testing.assert_array_almost_equal(report['error'].values, 0, decimal=10)
+
+    return None
+
+
+def test_solve_multiplier(monkeypatch):
+
+    rng = np.random.default_rng(2)
+    skill_values = [-0.2, 0, 0.3, 0.6, 0.9, 1]
+    observations = np.cumsum(rng.gamma(0.5, 4, (5, 60)), axis=1)
+    benchmark = np.abs(observations * rng.uniform(0.5, 1.5, (5, 1)) + rng.normal(0, 3, (5, 60)))
+    clear_multiplier_cache()
+
+    # Numerical solutions match closed forms
+    for skill_name in ['MAE', 'MSE', 'RMSE', 'NSE']:
+        k = solve_multiplier(skill_values[1:], skill_name, observations, benchmark)
+        assert k.shape == (5, 5)
+        closed_form = skill_to_multiplier(skill_values[1:], skill_name)
+        np.testing.assert_array_almost_equal(k, np.repeat(closed_form[:, np.newaxis], 5, axis=1), decimal=10)
+
+    # Metrics without closed form, for many init dates at once: target skill is achieved
+    for skill_name in ['logNSE', 'KGE']:
+        k = solve_multiplier(skill_values, skill_name, observations, benchmark)
+        np.testing.assert_array_almost_equal(achieved_skill(k, skill_name, observations, benchmark),
+                                             np.repeat(np.array(skill_values)[:, np.newaxis], 5, axis=1), decimal=8)
+
+    # Results are memoised
+    calls = []
+    monkeypatch.setattr(multiplier, 'achieved_skill', lambda *args: calls.append(args) or achieved_skill(*args))
+    k_again = solve_multiplier(skill_values[::-1], 'KGE', observations, benchmark)
+    np.testing.assert_array_equal(k_again, k[::-1])
+    assert len(calls) == 0
+
+    # Deterministic families on KGE reach their target skill
+    family = generate_family(pd.Series(observations[0]), pd.Series(benchmark[0]), skill_values[1:], 'KGE')
+    kge = multiplier.METRICS['KGE']['score']
+    benchmark_kge = kge(benchmark[0], observations[0])
+    np.testing.assert_array_almost_equal((kge(family.values.T, observations[0]) - benchmark_kge) / (1 - benchmark_kge),
+                                         skill_values[1:], decimal=8)
+
+    return None